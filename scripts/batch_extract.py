@@ -0,0 +1,221 @@
+"""Extraction par lots de plusieurs livres de PDF_MAPPING, suivie de l'annotation.
+
+Chaque livre (clé de `PDF_MAPPING` et plage de pages) est extrait dans un
+processus distinct, puis le fichier YAML produit est annoté par
+`yaml_annotate.process_file` dans le même processus. L'échec d'un livre
+n'interrompt pas les autres.
+
+La sortie standard ne contient qu'un rapport JSON par ligne : une ligne par
+livre terminé (statut, durées, nombre de sections, résultat de l'annotation),
+puis une ligne de synthèse. Les messages des étapes sont renvoyés sur la
+sortie d'erreur.
+
+Usage (depuis le dossier spadalibreria/) :
+    uv run extract-batch manciolino=1-65 marozzo_l2=20-80
+    uv run extract-batch --manifest pages.yaml --jobs 4 --report data/.cache/batch.json
+
+Le manifeste associe chaque clé de PDF_MAPPING à sa plage de pages :
+    manciolino: "1-65"
+    marozzo_l2: "20-80"
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scripts.extract_book import (
+    DEFAULT_FONT_SIZES, PDF_MAPPING, convert_to_yaml_structure, extract_text_elements,
+    merge_sections, output_path, parse_page_range, write_sections,
+)
+from scripts.treatise_store import setup_reader
+from scripts.word_cache import WordCache
+from scripts.yaml_annotate import TextEnricher, load_glossary, process_file
+
+# Enrichisseur partagé par tous les livres d'un processus, fixé par _init_worker
+# (None : pas d'annotation)
+_worker_enricher = None
+
+
+def _init_worker(enricher):
+    global _worker_enricher
+    _worker_enricher = enricher
+
+
+def run_book(key, pages, use_cache=True, rebuild_cache=False, merge=False):
+    """Extrait puis annote un livre. Renvoie son rapport, sans jamais lever d'exception.
+
+    Avec `merge`, les sections sont fusionnées dans le fichier existant (voir
+    `extract_book.merge_sections`) au lieu de l'écraser.
+    """
+    report = {"book": key, "pages": pages, "status": "ok"}
+    start = time.perf_counter()
+    try:
+        # Les messages des étapes ne doivent pas se mêler au rapport JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            config = PDF_MAPPING[key]
+            page_range = parse_page_range(pages)
+            if not page_range:
+                raise ValueError(f"Plage de pages invalide : {pages}")
+            cache = WordCache(config["pdf"], rebuild=rebuild_cache) if use_cache else None
+            title_list = extract_text_elements(config["pdf"], page_range, cache=cache,
+                                               font_sizes=config.get("font_sizes", DEFAULT_FONT_SIZES))
+            output_filename = output_path(config)
+            sections = convert_to_yaml_structure(title_list, config)
+            if merge:
+                summary = merge_sections(sections, output_filename, _worker_enricher)
+                section_count = len(summary["added"]) + len(summary["updated"]) + summary["unchanged"]
+                report["merge"] = {"added": summary["added"], "updated": summary["updated"],
+                                   "unchanged": summary["unchanged"], "kept": summary["kept"],
+                                   "written": summary["written"]}
+            else:
+                section_count = write_sections(sections, output_filename)
+            report.update(output=output_filename, page_count=len(page_range),
+                          sections=section_count,
+                          extract_seconds=round(time.perf_counter() - start, 3))
+
+            if _worker_enricher is not None:
+                annotate_start = time.perf_counter()
+                result = process_file(output_filename, _worker_enricher)
+                if result is None:
+                    raise RuntimeError(f"Annotation impossible de {output_filename}")
+                report.update(annotation=result,
+                              annotate_seconds=round(time.perf_counter() - annotate_start, 3))
+    except Exception as e:
+        report.update(status="error", error=f"{type(e).__name__}: {e}")
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    return report
+
+
+def run_batch(books, enricher=None, jobs=None, use_cache=True, rebuild_cache=False, merge=False):
+    """Traite les livres `{clé: pages}` en parallèle. Renvoie les rapports au fil de l'eau."""
+    jobs = min(jobs or os.cpu_count() or 1, len(books))
+    if jobs <= 1:
+        _init_worker(enricher)
+        for key, pages in books.items():
+            yield run_book(key, pages, use_cache, rebuild_cache, merge)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(enricher,)) as executor:
+        futures = {executor.submit(run_book, key, pages, use_cache, rebuild_cache, merge): (key, pages)
+                   for key, pages in books.items()}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # Processus de travail interrompu (mémoire, signal...)
+                key, pages = futures[future]
+                yield {"book": key, "pages": pages, "status": "error",
+                       "error": f"{type(e).__name__}: {e}"}
+
+
+def parse_books(specs, manifest):
+    """Livres à traiter, `{clé: pages}`, depuis le manifeste puis les arguments `clé=pages`."""
+    books = {}
+    if manifest:
+        with open(manifest, "r", encoding="utf-8") as f:
+            books.update({str(key): str(pages) for key, pages in (setup_reader().load(f) or {}).items()})
+    for spec in specs:
+        key, separator, pages = spec.partition("=")
+        if not separator:
+            raise ValueError(f"Argument invalide : {spec} (attendu : clé=pages)")
+        books[key] = pages
+
+    unknown = [key for key in books if key not in PDF_MAPPING]
+    if unknown:
+        raise ValueError(f"Clés inconnues : {', '.join(unknown)} (disponibles : {', '.join(PDF_MAPPING)})")
+    outputs = {}
+    for key in books:
+        other = outputs.setdefault(output_path(PDF_MAPPING[key]), key)
+        if other != key:
+            raise ValueError(f"{other} et {key} produiraient le même fichier {output_path(PDF_MAPPING[key])}")
+    return books
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extraire et annoter plusieurs livres de PDF_MAPPING en parallèle"
+    )
+    parser.add_argument(
+        "books",
+        nargs="*",
+        help="Livres à extraire, sous la forme clé=pages (ex: manciolino=1-65)"
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Fichier YAML associant chaque clé de PDF_MAPPING à sa plage de pages"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Nombre de livres traités en parallèle (défaut : un par CPU)"
+    )
+    parser.add_argument(
+        "--no-annotate",
+        action="store_true",
+        help="Ne pas annoter les fichiers extraits"
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="Fusionner les sections dans les fichiers existants (d'après leur id) au lieu de les écraser"
+    )
+    parser.add_argument(
+        "--glossary",
+        default="data/glossary.yaml",
+        help="Glossaire utilisé pour l'annotation (défaut : data/glossary.yaml)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ne pas utiliser le cache des mots extraits (data/.cache/words)"
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Ignorer les entrées existantes du cache et les réécrire"
+    )
+    parser.add_argument(
+        "--report",
+        help="Écrire aussi le rapport complet (JSON) dans ce fichier"
+    )
+    args = parser.parse_args()
+
+    try:
+        books = parse_books(args.books, args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not books:
+        parser.error("aucun livre à extraire (arguments clé=pages ou --manifest)")
+
+    enricher = None
+    if not args.no_annotate:
+        with contextlib.redirect_stdout(sys.stderr):
+            enricher = TextEnricher(load_glossary(args.glossary))
+
+    start = time.perf_counter()
+    reports = []
+    for report in run_batch(books, enricher, args.jobs, not args.no_cache, args.rebuild_cache,
+                            args.merge):
+        reports.append(report)
+        print(json.dumps({"event": "book", "done": len(reports), "total": len(books), **report},
+                         ensure_ascii=False), flush=True)
+
+    failed = [report["book"] for report in reports if report["status"] != "ok"]
+    summary = {"event": "summary", "books": len(reports), "ok": len(reports) - len(failed),
+               "failed": failed, "seconds": round(time.perf_counter() - start, 3)}
+    print(json.dumps(summary, ensure_ascii=False), flush=True)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "books": reports}, f, ensure_ascii=False, indent=1)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
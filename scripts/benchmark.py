@@ -0,0 +1,549 @@
+"""Mesure du débit des étapes d'extraction et d'enrichissement.
+
+`extract` : les mots de chaque page des PDF fournis avec le dépôt sont lus une
+fois (via le cache disque de `extract_book`), puis la classification et la
+construction de la hiérarchie sont chronométrées seules, en mots par seconde.
+
+`enrich` : chaque backend de recherche des termes du glossaire
+(`yaml_annotate.MATCHERS`) enrichit tous les textes du corpus, avec le
+glossaire réel complété par des termes synthétiques.
+
+`load` : chaque traité et le glossaire sont chargés avec chaque chargeur YAML
+(`LOADERS`) : aller-retour ruamel, réservé aux sections réécrites, et lecture
+seule (libyaml, ou Python pur à défaut), utilisée pour l'analyse.
+
+`suite` : chaque étape critique (voir `STAGES`) est mesurée sur les PDF et les
+traités fournis, puis sur des corpus synthétiques agrandis (sections
+répétées). Chaque mesure tourne dans un processus neuf, pour relever le pic de
+mémoire (RSS) propre à l'étape. Les résultats peuvent être enregistrés en JSON
+et comparés à une mesure de référence.
+
+Usage (depuis le dossier spadalibreria/) :
+    uv run benchmark extract
+    uv run benchmark extract --repeat 20 "data/treatises/Antonio Manciolino - opéra nova.pdf"
+    uv run benchmark enrich --synthetic-terms 10000
+    uv run benchmark load --repeat 10
+    uv run benchmark suite --scales 1,10,100 --save data/.cache/bench.json
+    uv run benchmark suite --compare data/.cache/bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pdfplumber
+from ruamel.yaml import YAML
+
+from scripts import extract_book
+from scripts.extract_book import (
+    PDF_MAPPING, Chapter, build_text_elements, classify_pages, convert_to_yaml_structure,
+    create_and_append_paragraphs, extract_text_elements, iter_cached_pages,
+)
+from scripts.treatise_store import section_offsets, setup_reader, setup_yaml
+from scripts.word_cache import WordCache
+from scripts.yaml_annotate import MATCHERS, TextEnricher, load_glossary, process_file
+
+DEFAULT_PDFS = [
+    "data/treatises/Antonio Manciolino - opéra nova.pdf",
+    "data/treatises/Antonio Manciolino - opéra nova - livre 4.pdf",
+    "data/treatises/Antonio Manciolino - opéra nova - livre 5.pdf",
+]
+
+
+def best_time(func, repeat):
+    """Meilleur temps (en secondes) sur `repeat` exécutions de `func`."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_classification(pdf_path, repeat):
+    """Débit de `classify_pages` + `build_text_elements` sur toutes les pages d'un PDF."""
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+    pages = list(iter_cached_pages(pdf_path, range(page_count), cache=WordCache(pdf_path)))
+    word_count = sum(len(page_words) for page_words in pages)
+    elapsed = best_time(lambda: build_text_elements(classify_pages(pages)), repeat)
+    return page_count, word_count, elapsed
+
+
+def corpus_texts(treatises_dir):
+    """Tous les champs de texte enrichis par yaml_annotate (it, fr, en_versions[].text)."""
+    yaml = setup_reader()
+    texts = []
+    for path in sorted(Path(treatises_dir).glob("*.yaml")):
+        with open(path, "r", encoding="utf-8") as f:
+            sections = yaml.load(f) or []
+        for section in sections:
+            content = section.get("content") or {}
+            fields = [content.get("it"), content.get("fr")]
+            fields += [version.get("text") for version in content.get("en_versions") or []]
+            texts += [text for text in fields if isinstance(text, str)]
+    return texts
+
+
+def synthetic_glossary(count, seed=0):
+    """Glossaire synthétique de `count` termes d'un à trois mots, à l'allure italienne."""
+    rng = random.Random(seed)
+    syllables = ["ma", "dri", "tto", "ro", "ver", "so", "fen", "den", "te", "por",
+                 "ta", "fer", "co", "da", "lon", "ga", "stoc", "ca", "gua", "sgu",
+                 "lem", "bra", "fal", "tra", "maz", "zo", "ne", "pun", "li", "ghi"]
+    glossary = {}
+    while len(glossary) < count:
+        term = " ".join("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+                        for _ in range(rng.randint(1, 3)))
+        key = "synthetic_" + term.replace(" ", "_")
+        glossary[key] = {"term": term, "type": "Attaque / Frappe de taille"}
+    return glossary
+
+
+def equivalence_texts(texts, glossary_data):
+    """Textes de vérification des backends : le corpus, sa forme décomposée (NFD)
+    et les termes du glossaire entourés de signes diacritiques combinants, de
+    tags suivis d'un accent et de ligatures doublées."""
+    cases = texts + [unicodedata.normalize("NFD", text) for text in texts]
+    for entry in glossary_data.values():
+        term = str((entry or {}).get("term") or "")
+        if term:
+            cases += [f"c_e\u0301{term.upper()}", f"{term}\u0301 ", f"\u0327{term}",
+                      f"e\u0301 {term}\u0301\u0301{term}", unicodedata.normalize("NFD", f"é{term}é"),
+                      # Tag suivi d'un accent combinant, ligature doublée (ﬁﬁ se replie en fi)
+                      f"{{i}}\u0301 {term}", f"{{{term}}}\u0301\u0301", term.lower().replace("fi", "\ufb01\ufb01"),
+                      f"\ufb01\ufb01 {term} \ufb01\ufb01"]
+    return cases
+
+
+def bench_enrichment(texts, glossary_data, repeat):
+    """Temps de construction et d'enrichissement du corpus pour chaque backend.
+
+    Vérifie au passage que tous les backends produisent le même texte et les
+    mêmes références, sur le corpus et sur des cas à signes diacritiques
+    combinants (equivalence_texts).
+    """
+    results = {}
+    reference = None
+    checked = equivalence_texts(texts, glossary_data)
+    for name in MATCHERS:
+        start = time.perf_counter()
+        enricher = TextEnricher(glossary_data, matcher=name)
+        build_time = time.perf_counter() - start
+        enrich_time = best_time(lambda: [enricher.enrich(text) for text in texts], repeat)
+        output = [enricher.enrich_with_counts(text) for text in checked]
+        if reference is None:
+            reference = output
+        elif output != reference:
+            raise AssertionError(f"Le backend {name} ne produit pas le même texte que les autres")
+        results[name] = (build_time, enrich_time)
+    return results
+
+
+# Chargeurs comparés par `load` : nom -> fabrique d'instance YAML
+LOADERS = {
+    "aller-retour": setup_yaml,
+    "lecture": setup_reader,
+    "lecture (Python)": lambda: YAML(typ="safe", pure=True),
+}
+
+
+def corpus_sources(treatises_dir, glossary_path):
+    """Contenu brut des traités et du glossaire, `{chemin: octets}`."""
+    paths = sorted(Path(treatises_dir).glob("*.yaml")) + [Path(glossary_path)]
+    return {path: path.read_bytes() for path in paths}
+
+
+def bench_loaders(sources, repeat):
+    """Temps de chargement de toutes les sources pour chaque chargeur (`LOADERS`).
+
+    Vérifie au passage que tous les chargeurs produisent les mêmes données.
+    """
+    results = {}
+    reference = None
+    for name, factory in LOADERS.items():
+        yaml = factory()
+        elapsed = best_time(lambda: [yaml.load(raw) for raw in sources.values()], repeat)
+        output = json.dumps([yaml.load(raw) for raw in sources.values()], ensure_ascii=False, default=str)
+        if reference is None:
+            reference = output
+        elif output != reference:
+            raise AssertionError(f"Le chargeur {name} ne produit pas les mêmes données que les autres")
+        results[name] = elapsed
+    return results
+
+
+def pdf_pages(pdf_path):
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def extracted_books(pdfs):
+    """Hiérarchie extraite de chaque PDF, avec les textes passés à `create_and_append_paragraphs`."""
+    paragraph_texts = []
+
+    def record(text, chapter):
+        paragraph_texts.append(text)
+        return create_and_append_paragraphs(text, chapter)
+
+    extract_book.create_and_append_paragraphs = record
+    try:
+        title_lists = [extract_text_elements(pdf_path, range(1, pdf_pages(pdf_path) + 1),
+                                             cache=WordCache(pdf_path))
+                       for pdf_path in pdfs]
+    finally:
+        extract_book.create_and_append_paragraphs = create_and_append_paragraphs
+    return title_lists, paragraph_texts
+
+
+def scaled_treatises(treatises_dir, target_dir, scale):
+    """Copie les traités en répétant `scale` fois chaque section (ids suffixés `_x<n>`)."""
+    target_dir = Path(target_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    section_count = 0
+    for path in sorted(Path(treatises_dir).glob("*.yaml")):
+        raw = path.read_bytes()
+        blocks = [raw[offset:offset + length] for _, offset, length in section_offsets(raw)]
+        blocks = [block if block.endswith(b"\n") else block + b"\n" for block in blocks]
+        copies = [blocks] + [[re.sub(rb"^- id: *(.*)$", rb"- id: \1_x%d" % copy, block, count=1,
+                                     flags=re.MULTILINE) for block in blocks]
+                             for copy in range(1, scale)]
+        (target_dir / path.name).write_bytes(b"".join(block for copy in copies for block in copy))
+        section_count += len(blocks) * scale
+    return section_count
+
+
+# Étapes de `suite` : chaque fonction prépare les données d'une échelle et renvoie
+# (exécution, préparation avant chaque exécution ou None, unités traitées par exécution)
+
+def stage_extract_text_elements(scale, args):
+    books = []
+    caches = {}
+    words = 0
+    for pdf_path in args.pdfs:
+        page_count = pdf_pages(pdf_path)
+        caches[pdf_path] = WordCache(pdf_path)
+        # Remplit le cache au besoin : la lecture du PDF par pdfplumber n'est pas mesurée
+        words += scale * sum(len(page_words) for page_words in
+                             iter_cached_pages(pdf_path, range(page_count), cache=caches[pdf_path]))
+        books.append((pdf_path, list(range(1, page_count + 1)) * scale))
+
+    def run():
+        for pdf_path, pages in books:
+            extract_text_elements(pdf_path, pages, cache=caches[pdf_path])
+    return run, None, {"pages": sum(len(pages) for _, pages in books), "words": words}
+
+
+def stage_create_and_append_paragraphs(scale, args):
+    texts = extracted_books(args.pdfs)[1] * scale
+
+    def run():
+        for text in texts:
+            create_and_append_paragraphs(text, Chapter("", 0, None))
+    return run, None, {"chapters": len(texts), "chars": sum(len(text) for text in texts)}
+
+
+def stage_convert_to_yaml_structure(scale, args):
+    title_lists = extracted_books(args.pdfs)[0] * scale
+    config = PDF_MAPPING["manciolino"]
+    sections = sum(1 for title_list in title_lists for _ in convert_to_yaml_structure(title_list, config))
+
+    def run():
+        for title_list in title_lists:
+            for _ in convert_to_yaml_structure(title_list, config):
+                pass
+    return run, None, {"sections": sections}
+
+
+def _stage_enrich(scale, args, glossary_data):
+    texts = corpus_texts(args.treatises) * scale
+    section_count = sum(1 for path in Path(args.treatises).glob("*.yaml")
+                        for _ in section_offsets(path.read_bytes())) * scale
+    enricher = TextEnricher(glossary_data)
+
+    def run():
+        for text in texts:
+            enricher.enrich(text)
+    return run, None, {"sections": section_count, "chars": sum(len(text) for text in texts)}
+
+
+def stage_enrich(scale, args):
+    return _stage_enrich(scale, args, dict(load_glossary(args.glossary)))
+
+
+def stage_enrich_large_glossary(scale, args):
+    glossary_data = dict(load_glossary(args.glossary))
+    return _stage_enrich(scale, args, {**synthetic_glossary(args.synthetic_terms), **glossary_data})
+
+
+def stage_load_corpus(scale, args):
+    # Chargement en lecture seule, comme corpus_index et les statistiques
+    temporary = tempfile.TemporaryDirectory(prefix="spada_bench_")
+    section_count = scaled_treatises(args.treatises, temporary.name, scale)
+    sources = corpus_sources(temporary.name, args.glossary)
+    yaml = setup_reader()
+
+    def run():
+        temporary  # garder le dossier temporaire en vie tant que l'étape existe
+        for raw in sources.values():
+            yaml.load(raw)
+    return run, None, {"sections": section_count, "Mo": sum(map(len, sources.values())) / 1e6}
+
+
+def stage_process_file(scale, args):
+    # Supprimé avec l'objet, à la fin du processus de mesure
+    temporary = tempfile.TemporaryDirectory(prefix="spada_bench_")
+    work_dir = Path(temporary.name)
+    source_dir = work_dir / "source"
+    section_count = scaled_treatises(args.treatises, source_dir, scale)
+    enricher = TextEnricher(load_glossary(args.glossary))
+    files = [work_dir / "treatises" / path.name for path in sorted(source_dir.glob("*.yaml"))]
+
+    def prepare():
+        # Repartir des fichiers non annotés, sans manifeste
+        shutil.rmtree(work_dir / "treatises", ignore_errors=True)
+        shutil.rmtree(work_dir / "manifests", ignore_errors=True)
+        shutil.copytree(source_dir, work_dir / "treatises")
+
+    def run():
+        temporary  # garder le dossier temporaire en vie tant que l'étape existe
+        for path in files:
+            process_file(path, enricher, manifest_dir=work_dir / "manifests")
+    return run, prepare, {"sections": section_count}
+
+
+STAGES = {
+    "extract_text_elements": stage_extract_text_elements,
+    "create_and_append_paragraphs": stage_create_and_append_paragraphs,
+    "convert_to_yaml_structure": stage_convert_to_yaml_structure,
+    "enrich": stage_enrich,
+    "enrich_large_glossary": stage_enrich_large_glossary,
+    "load_corpus": stage_load_corpus,
+    "process_file": stage_process_file,
+}
+
+
+def measure_stage(name, scale, args):
+    """Mesure une étape à une échelle (dans le processus courant)."""
+    run, prepare, units = STAGES[name](scale, args)
+    best = float("inf")
+    for _ in range(args.repeat):
+        if prepare:
+            prepare()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    # ru_maxrss est en kilo-octets sous Linux, en octets sous macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    return {"stage": name, "scale": scale, "seconds": best, "units": units,
+            "throughput": {f"{unit}/s": count / best for unit, count in units.items()},
+            "peak_rss_kb": peak_rss}
+
+
+def run_suite(args):
+    scales = [int(scale) for scale in args.scales.split(",")]
+    stages = args.stages.split(",") if args.stages else list(STAGES)
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise SystemExit(f"Étapes inconnues : {', '.join(unknown)} (disponibles : {', '.join(STAGES)})")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = {(result["stage"], result["scale"]): result for result in json.load(f)["results"]}
+
+    print(f"{'étape':<30} {'échelle':>7} {'temps (ms)':>11} {'RSS max (Mo)':>13}  débit")
+    results = []
+    regressions = []
+    context = multiprocessing.get_context("spawn")
+    for name in stages:
+        for scale in scales:
+            # Un processus neuf par mesure : le pic de mémoire est celui de l'étape seule
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(measure_stage, name, scale, args).result()
+            results.append(result)
+            throughput = ", ".join(f"{value:,.0f} {unit}" for unit, value in result["throughput"].items())
+            line = (f"{name:<30} {scale:>6}× {result['seconds'] * 1000:>11.2f} "
+                    f"{result['peak_rss_kb'] / 1024:>13.1f}  {throughput}")
+            reference = baseline and baseline.get((name, scale))
+            if reference:
+                change = result["seconds"] / reference["seconds"] - 1
+                line += f"  ({change:+.1%})"
+                if change > args.threshold:
+                    regressions.append((name, scale, change))
+                    line += " RÉGRESSION"
+            print(line, flush=True)
+
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                       "machine": platform.platform(), "repeat": args.repeat, "results": results},
+                      f, ensure_ascii=False, indent=1)
+        print(f"Mesures enregistrées dans {args.save}")
+    if regressions:
+        print(f"{len(regressions)} régression(s) au-delà de {args.threshold:.0%}")
+        sys.exit(1)
+
+
+def run_extract(args):
+    print(f"{'PDF':<50} {'pages':>6} {'mots':>8} {'temps (ms)':>11} {'mots/s':>12}")
+    for pdf_path in args.pdfs:
+        page_count, word_count, elapsed = bench_classification(pdf_path, args.repeat)
+        name = pdf_path.rsplit("/", 1)[-1]
+        print(f"{name:<50} {page_count:>6} {word_count:>8} "
+              f"{elapsed * 1000:>11.2f} {word_count / elapsed:>12,.0f}")
+
+
+def run_enrich(args):
+    texts = corpus_texts(args.treatises)
+    chars = sum(len(text) for text in texts)
+    glossary_data = dict(load_glossary(args.glossary))
+    glossaries = [("réel", glossary_data)]
+    if args.synthetic_terms:
+        glossaries.append((f"+{args.synthetic_terms} synth.",
+                           {**synthetic_glossary(args.synthetic_terms), **glossary_data}))
+
+    print(f"Corpus : {len(texts)} textes, {chars} caractères")
+    print(f"{'glossaire':<16} {'backend':<8} {'termes':>7} {'construction (ms)':>18} "
+          f"{'enrichissement (ms)':>20} {'caractères/s':>14}")
+    for label, data in glossaries:
+        for name, (build_time, enrich_time) in bench_enrichment(texts, data, args.repeat).items():
+            print(f"{label:<16} {name:<8} {len(data):>7} {build_time * 1000:>18.2f} "
+                  f"{enrich_time * 1000:>20.2f} {chars / enrich_time:>14,.0f}")
+
+
+def run_load(args):
+    sources = corpus_sources(args.treatises, args.glossary)
+    size = sum(len(raw) for raw in sources.values())
+    print(f"Corpus : {len(sources)} fichiers, {size / 1024:.0f} Ko")
+    print(f"{'chargeur':<18} {'temps (ms)':>11} {'Mo/s':>8} {'gain':>7}")
+    results = bench_loaders(sources, args.repeat)
+    round_trip = results["aller-retour"]
+    for name, elapsed in results.items():
+        print(f"{name:<18} {elapsed * 1000:>11.2f} {size / elapsed / 1e6:>8.2f} {round_trip / elapsed:>6.1f}×")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mesurer le débit des étapes d'extraction et d'enrichissement"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Nombre d'exécutions, le meilleur temps est retenu (défaut : 5)"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    extract_parser = subparsers.add_parser(
+        "extract", help="Classification des mots extraits des PDF (mots/s)")
+    extract_parser.add_argument(
+        "pdfs",
+        nargs="*",
+        default=DEFAULT_PDFS,
+        help="Fichiers PDF à utiliser (défaut : PDF de Manciolino fournis)"
+    )
+    extract_parser.set_defaults(func=run_extract)
+
+    enrich_parser = subparsers.add_parser(
+        "enrich", help="Recherche des termes du glossaire, pour chaque backend")
+    enrich_parser.add_argument(
+        "--glossary",
+        default="data/glossary.yaml",
+        help="Glossaire réel (défaut : data/glossary.yaml)"
+    )
+    enrich_parser.add_argument(
+        "--treatises",
+        default="data/treatises",
+        help="Dossier des traités YAML (défaut : data/treatises)"
+    )
+    enrich_parser.add_argument(
+        "--synthetic-terms",
+        type=int,
+        default=10000,
+        help="Nombre de termes synthétiques ajoutés au glossaire (défaut : 10000, 0 pour aucun)"
+    )
+    enrich_parser.set_defaults(func=run_enrich)
+
+    load_parser = subparsers.add_parser(
+        "load", help="Chargement du corpus YAML, aller-retour contre lecture seule")
+    load_parser.add_argument(
+        "--glossary",
+        default="data/glossary.yaml",
+        help="Glossaire réel (défaut : data/glossary.yaml)"
+    )
+    load_parser.add_argument(
+        "--treatises",
+        default="data/treatises",
+        help="Dossier des traités YAML (défaut : data/treatises)"
+    )
+    load_parser.set_defaults(func=run_load)
+
+    suite_parser = subparsers.add_parser(
+        "suite", help="Toutes les étapes critiques, à plusieurs échelles, avec pic mémoire")
+    suite_parser.add_argument(
+        "--scales",
+        default="1,10,100",
+        help="Facteurs d'agrandissement du corpus, séparés par des virgules (défaut : 1,10,100)"
+    )
+    suite_parser.add_argument(
+        "--stages",
+        help=f"Étapes à mesurer, séparées par des virgules (défaut : toutes, {', '.join(STAGES)})"
+    )
+    suite_parser.add_argument(
+        "--pdfs",
+        nargs="*",
+        default=DEFAULT_PDFS,
+        help="Fichiers PDF à utiliser (défaut : PDF de Manciolino fournis)"
+    )
+    suite_parser.add_argument(
+        "--glossary",
+        default="data/glossary.yaml",
+        help="Glossaire réel (défaut : data/glossary.yaml)"
+    )
+    suite_parser.add_argument(
+        "--treatises",
+        default="data/treatises",
+        help="Dossier des traités YAML (défaut : data/treatises)"
+    )
+    suite_parser.add_argument(
+        "--synthetic-terms",
+        type=int,
+        default=10000,
+        help="Taille du glossaire synthétique de l'étape enrich_large_glossary (défaut : 10000)"
+    )
+    suite_parser.add_argument(
+        "--save",
+        help="Enregistrer les mesures dans ce fichier JSON"
+    )
+    suite_parser.add_argument(
+        "--compare",
+        help="Comparer les temps à ceux d'un fichier JSON enregistré avec --save"
+    )
+    suite_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Ralentissement relatif signalé comme régression avec --compare (défaut : 0.10)"
+    )
+    suite_parser.set_defaults(func=run_suite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
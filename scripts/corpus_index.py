@@ -0,0 +1,256 @@
+"""
+Compile the treatise and glossary YAML files into one SQLite snapshot.
+
+Loading YAML is the slowest part of every consumer of the corpus. The snapshot
+stores each section and glossary entry as JSON, plus the file, line and byte
+range of each section block in its source file, so readers get O(1) lookups by
+section id without parsing YAML. Sources are only re-parsed when their size,
+mtime and content hash change.
+
+Usage (from the spadalibreria/ folder):
+    uv run build-index
+    uv run build-index --force
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from scripts.treatise_store import section_offsets, setup_reader
+
+DEFAULT_TREATISES_DIR = "data/treatises"
+DEFAULT_GLOSSARY = "data/glossary.yaml"
+DEFAULT_INDEX_PATH = "data/.cache/corpus.sqlite"
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    file TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    id TEXT,
+    line INTEGER,
+    byte_offset INTEGER,
+    byte_length INTEGER,
+    title TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (file, position)
+);
+CREATE INDEX IF NOT EXISTS sections_by_id ON sections (id);
+CREATE TABLE IF NOT EXISTS glossary (
+    key TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+
+def _to_json(value):
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class CorpusIndex:
+    """Read and update the SQLite snapshot of the corpus."""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        version = None
+        if self.db.execute("SELECT name FROM sqlite_master WHERE name = 'meta'").fetchone():
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+            version = row and int(row[0])
+        if version != SCHEMA_VERSION:
+            self.reset()
+
+    def close(self):
+        self.db.close()
+
+    def reset(self):
+        """Drop every table and recreate an empty snapshot."""
+        with self.db:
+            for table in ("meta", "sources", "sections", "glossary"):
+                self.db.execute(f"DROP TABLE IF EXISTS {table}")
+            self.db.executescript(SCHEMA)
+            self.db.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+
+    # Reading
+
+    def get_section(self, section_id):
+        """
+        Return the section as plain data, or None if the id is unknown.
+        A duplicated id resolves to its first occurrence in file order.
+        """
+        row = self.db.execute(
+            "SELECT data FROM sections WHERE id = ? ORDER BY file, position LIMIT 1",
+            (section_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def locate_section(self, section_id):
+        """Return (file, line, byte_offset, byte_length) of a section block, or None."""
+        return self.db.execute(
+            "SELECT file, line, byte_offset, byte_length FROM sections WHERE id = ? "
+            "ORDER BY file, position LIMIT 1", (section_id,)).fetchone()
+
+    def iter_sections(self, file=None):
+        """Yield (file, section) for every section, in file order."""
+        query = "SELECT file, data FROM sections"
+        params = ()
+        if file is not None:
+            query += " WHERE file = ?"
+            params = (str(file),)
+        for row_file, data in self.db.execute(query + " ORDER BY file, position", params):
+            yield row_file, json.loads(data)
+
+    def duplicate_ids(self):
+        """Return [(id, [file, ...])] for every id carried by several sections."""
+        return [(section_id, files.split("\n")) for section_id, files in self.db.execute(
+            "SELECT id, group_concat(file, char(10)) FROM "
+            "(SELECT id, file FROM sections WHERE id IS NOT NULL ORDER BY file, position) "
+            "GROUP BY id HAVING COUNT(*) > 1 ORDER BY id")]
+
+    def glossary(self):
+        """Return the glossary as a dict of key -> entry, in file order."""
+        return {key: json.loads(data) for key, data in
+                self.db.execute("SELECT key, data FROM glossary ORDER BY position")}
+
+    # Building
+
+    def _source_changed(self, path, kind, force):
+        """
+        Tell whether a source file must be re-parsed.
+        Returns (changed, raw_bytes_or_None, stat_row).
+        """
+        stat = path.stat()
+        row = self.db.execute("SELECT mtime_ns, size, sha256 FROM sources WHERE path = ?",
+                              (str(path),)).fetchone()
+        if not force and row and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+            return False, None, None
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        source_row = (str(path), kind, stat.st_mtime_ns, stat.st_size, digest)
+        if not force and row and row[2] == digest:
+            # Touched but identical: only refresh the stat data
+            self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)", source_row)
+            return False, None, None
+        return True, raw, source_row
+
+    def update_treatise(self, path, force=False):
+        """Re-index one treatise file if it changed. Returns True if it was re-parsed."""
+        changed, raw, source_row = self._source_changed(path, "treatise", force)
+        if not changed:
+            return False
+        sections = setup_reader().load(raw) or []
+        offsets = section_offsets(raw)
+        if len(offsets) != len(sections):
+            # Unexpected layout: keep the sections, without their location
+            offsets = [(None, None, None)] * len(sections)
+        self.db.execute("DELETE FROM sections WHERE file = ?", (str(path),))
+        self.db.executemany(
+            "INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(str(path), position, None if section.get("id") is None else str(section["id"]),
+              line, byte_offset, byte_length, section.get("title"), _to_json(section))
+             for position, (section, (line, byte_offset, byte_length))
+             in enumerate(zip(sections, offsets))])
+        self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)", source_row)
+        return True
+
+    def update_glossary(self, path, force=False):
+        """Re-index the glossary if it changed. Returns True if it was re-parsed."""
+        changed, raw, source_row = self._source_changed(path, "glossary", force)
+        if not changed:
+            return False
+        entries = setup_reader().load(raw) or {}
+        self.db.execute("DELETE FROM glossary")
+        self.db.executemany("INSERT INTO glossary VALUES (?, ?, ?)",
+                            [(key, position, _to_json(entry))
+                             for position, (key, entry) in enumerate(entries.items())])
+        self.db.execute("DELETE FROM sources WHERE kind = 'glossary'")
+        self.db.execute("INSERT INTO sources VALUES (?, ?, ?, ?, ?)", source_row)
+        return True
+
+    def build(self, treatises_dir=DEFAULT_TREATISES_DIR, glossary_path=DEFAULT_GLOSSARY,
+              force=False):
+        """
+        Bring the snapshot up to date with the YAML sources.
+        Returns (updated_files, unchanged_files, removed_files).
+        """
+        updated, unchanged = [], []
+        files = sorted(Path(treatises_dir).glob("*.yaml"))
+        with self.db:
+            for path in files:
+                (updated if self.update_treatise(path, force) else unchanged).append(path)
+            glossary_path = Path(glossary_path)
+            if glossary_path.exists():
+                (updated if self.update_glossary(glossary_path, force) else unchanged).append(glossary_path)
+
+            # Forget treatise files that were deleted or renamed
+            known = {str(path) for path in files}
+            removed = [row[0] for row in self.db.execute(
+                "SELECT path FROM sources WHERE kind = 'treatise'") if row[0] not in known]
+            for path in removed:
+                self.db.execute("DELETE FROM sections WHERE file = ?", (path,))
+                self.db.execute("DELETE FROM sources WHERE path = ?", (path,))
+        return updated, unchanged, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile treatise and glossary YAML files into a SQLite snapshot for fast lookups."
+    )
+    parser.add_argument(
+        "--treatises",
+        default=DEFAULT_TREATISES_DIR,
+        help=f"Folder of treatise YAML files (default: {DEFAULT_TREATISES_DIR})."
+    )
+    parser.add_argument(
+        "--glossary",
+        default=DEFAULT_GLOSSARY,
+        help=f"Path to the glossary YAML file (default: {DEFAULT_GLOSSARY})."
+    )
+    parser.add_argument(
+        "--output",
+        default=DEFAULT_INDEX_PATH,
+        help=f"Path of the snapshot (default: {DEFAULT_INDEX_PATH})."
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-parse every source even if it did not change."
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = CorpusIndex(args.output)
+    updated, unchanged, removed = index.build(args.treatises, args.glossary, args.force)
+    section_count = index.db.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+    missing_ids = index.db.execute("SELECT COUNT(*) FROM sections WHERE id IS NULL").fetchone()[0]
+    duplicates = index.duplicate_ids()
+    index.close()
+
+    for path in updated:
+        print(f"  indexed {path}")
+    for path in removed:
+        print(f"  removed {path}")
+    for section_id, files in duplicates:
+        print(f"  duplicate id {section_id} ({', '.join(files)})")
+    if missing_ids:
+        print(f"  {missing_ids} sections without id")
+    print(f"Snapshot {args.output}: {section_count} sections, {len(updated)} files re-indexed, "
+          f"{len(unchanged)} unchanged ({time.perf_counter() - start:.2f}s).")
+
+
+if __name__ == "__main__":
+    main()
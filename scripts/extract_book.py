@@ -1,62 +1,176 @@
+import hashlib
+import json
 import pdfplumber
 import re
+import sys
 import argparse
-from ruamel.yaml import YAML
+import difflib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
 from ruamel.yaml.scalarstring import LiteralScalarString
 
-yaml = YAML()
-yaml.preserve_quotes = True
-yaml.default_flow_style = False
+from scripts import profiling
+from scripts.treatise_store import TreatiseStore, atomic_open, atomic_write, dump_section, setup_yaml
+from scripts.word_cache import WordCache, file_hash
+from scripts.yaml_annotate import TextEnricher, load_glossary
 
 
+# Les éléments sont nombreux sur un livre entier : `__slots__` évite un
+# dictionnaire par instance.
+
 class TextElement:
+    __slots__ = ("text", "index")
+
     def __init__(self, text, index):
         self.text = text
         self.index = index
 
 
 class Title(TextElement):
+    __slots__ = ("_titles_1_list",)
+    SIZE = 80
+
     def __init__(self, text, index):
         super().__init__(text, index)
-        self.titles_1_list = [Title1("", 0, self)]
-        self.SIZE = 80
+        self._titles_1_list = None
+
+    @property
+    def titles_1_list(self):
+        """Titres de niveau 1. Le premier, sans texte, reçoit ce qui précède le premier
+        Title1 : il n'est créé que s'il reçoit du contenu (ou si la liste est lue vide)."""
+        if self._titles_1_list is None:
+            self._titles_1_list = [Title1("", 0, self)]
+        return self._titles_1_list
 
 
 class Title1(TextElement):
+    __slots__ = ("parent_title", "_chapter_list")
+    SIZE = 25
+
     def __init__(self, text, index, title):
         super().__init__(text, index)
         self.parent_title = title
-        self.chapter_list = [Chapter("", 0, self)]
-        self.SIZE = 25
+        self._chapter_list = None
+
+    @property
+    def chapter_list(self):
+        """Chapitres. Le premier, sans texte, reçoit ce qui précède le premier Chapter
+        (créé à la demande, comme dans Title.titles_1_list)."""
+        if self._chapter_list is None:
+            self._chapter_list = [Chapter("", 0, self)]
+        return self._chapter_list
 
 
 class Chapter(TextElement):
+    __slots__ = ("parent_title1", "paragraph_list")
+    SIZE = 20
+
     def __init__(self, text, index, title1):
         super().__init__(text, index)
         self.parent_title1 = title1
         self.paragraph_list = []
-        self.SIZE = 20
 
 
 class Paragraph(TextElement):
+    __slots__ = ("parent_chapter",)
+
     def __init__(self, text, index, chapter):
         super().__init__(text, index)
         self.parent_chapter = chapter
 
 
-def add_title(titles, text, index):
-    if len(titles) == 1 and titles[0].text == "":
+# Profil de tailles de police par défaut des titres. `tolerance` (en points,
+# entier) élargit chaque taille en bande : avec une tolérance de 1, un mot de
+# taille arrondie 19, 20 ou 21 est considéré comme un chapitre.
+DEFAULT_FONT_SIZES = {
+    "title": Title.SIZE,
+    "title1": Title1.SIZE,
+    "chapter": Chapter.SIZE,
+    "tolerance": 0,
+}
+
+HEADING_LEVELS = ("title", "title1", "chapter")
+
+# Sommaires des PDF (titres par page), voir load_outline
+DEFAULT_OUTLINE_DIR = "data/.cache/outlines"
+
+
+# Mapping des auteurs/livres vers leurs fichiers PDF, métadonnées et profil de tailles de police
+PDF_MAPPING = {
+    "marozzo": {
+        "pdf": "data/treatises/Achille Marozzo - opéra nova.pdf",
+        "master": "Achille Marozzo",
+        "master_id": "achille_marozzo",
+        "work": "Opera Nova",
+        "book": 1,
+        "year": 1536,
+        "font_sizes": {"title": 80, "title1": 25, "chapter": 20, "tolerance": 0}
+    },
+    "marozzo_l2": {
+        "pdf": "data/treatises/Achille Marozzo - opéra nova - livre 2.pdf",
+        "master": "Achille Marozzo",
+        "master_id": "achille_marozzo",
+        "work": "Opera Nova",
+        "book": 2,
+        "year": 1536,
+        "font_sizes": {"title": 80, "title1": 25, "chapter": 20, "tolerance": 0}
+    },
+    "manciolino": {
+        "pdf": "data/treatises/Antonio Manciolino - opéra nova.pdf",
+        "master": "Antonio Manciolino",
+        "master_id": "antonio_manciolino",
+        "work": "Opera Nova",
+        "book": 1,
+        "year": 1531,
+        "font_sizes": {"title": 80, "title1": 25, "chapter": 20, "tolerance": 0}
+    },
+}
+
+
+def size_snap_map(font_sizes):
+    """Associe chaque taille arrondie comprise dans une bande de titre à la taille nominale du niveau.
+
+    Les bandes sont testées dans l'ordre Title, Title1, Chapter : en cas de
+    chevauchement, le niveau le plus haut l'emporte.
+    """
+    tolerance = font_sizes.get("tolerance", 0)
+    snap = {}
+    for level in HEADING_LEVELS:
+        nominal = font_sizes[level]
+        for size in range(nominal - tolerance, nominal + tolerance + 1):
+            snap.setdefault(size, nominal)
+    return snap
+
+
+def add_title(titles, text, index, keep_leading_text=False):
+    # Le Title vide initial est remplacé par le premier titre, avec ce qu'il a reçu
+    if len(titles) == 1 and titles[0].text == "" and not (
+            keep_leading_text and titles[0]._titles_1_list is not None):
         titles[0] = Title(text.strip(), 0)
     else:
         titles.append(Title(text.strip(), index))
 
 
 def add_title1(text, index, title):
-    title.titles_1_list.append(Title1(text.strip(), index, title))
+    if title._titles_1_list is None:
+        # Rien avant ce premier Title1 : pas de Title1 vide
+        title._titles_1_list = []
+    title._titles_1_list.append(Title1(text.strip(), index, title))
 
 
 def add_chapter(text, index, title_1):
-    title_1.chapter_list.append(Chapter(text.strip(), index, title_1))
+    if title_1._chapter_list is None:
+        title_1._chapter_list = []
+    title_1._chapter_list.append(Chapter(text.strip(), index, title_1))
+
+
+def iter_chapters(title_list):
+    """Chapitres de la hiérarchie, dans l'ordre, sans créer les éléments vides."""
+    for title in title_list:
+        for title1 in title._titles_1_list or ():
+            yield from title1._chapter_list or ()
 
 
 def create_and_append_paragraphs(text, chapter):
@@ -74,87 +188,389 @@ def create_and_append_paragraphs(text, chapter):
         chapter.paragraph_list.append(Paragraph(para, para_index, chapter))
 
 
-def extract_text_elements(pdf_path, page_range):
+def extract_page_words(pdf_path, page_numbers):
+    """Extrait les mots des pages données (indexées à partir de zéro).
+
+    Ouvre son propre handle pdfplumber pour pouvoir être exécutée dans un
+    processus worker, et renvoie pour chaque page une liste d'enregistrements
+    compacts ``(text, size, doctop)`` plutôt que les dictionnaires de pdfplumber.
+    """
+    return list(iter_page_words(pdf_path, page_numbers))
+
+
+def iter_page_words(pdf_path, page_numbers):
+    """Générateur de pages : produit les mots de chaque page l'une après l'autre.
+
+    Les objets de mise en page de pdfplumber sont libérés dès qu'une page est
+    consommée, la mémoire ne dépend donc pas du nombre de pages demandées.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num in page_numbers:
+            page = pdf.pages[page_num]
+            page_words = [(word["text"], word["size"], word["doctop"])
+                          for word in page.extract_words(keep_blank_chars=True,
+                                                         extra_attrs=["size"])]
+            # Vide le cache de la page (objets, layout, textmap)
+            page.close()
+            yield page_words
+
+
+def iter_pages(pdf_path, page_numbers, jobs=1):
+    """Produit les mots page par page, en série ou répartis sur `jobs` processus.
+
+    En mode parallèle, les pages sont découpées en blocs contigus et seuls
+    quelques blocs sont en cours de traitement à la fois ; les résultats sont
+    produits dans l'ordre des pages, le résultat est donc identique au mode série.
+    """
+    page_numbers = list(page_numbers)
+    if jobs <= 1 or len(page_numbers) <= 1:
+        yield from iter_page_words(pdf_path, page_numbers)
+        return
+
+    # Plusieurs blocs par worker pour équilibrer la charge entre pages lourdes et légères
+    chunk_size = max(1, -(-len(page_numbers) // (jobs * 4)))
+    chunks = iter([page_numbers[i:i + chunk_size]
+                   for i in range(0, len(page_numbers), chunk_size)])
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque(executor.submit(extract_page_words, pdf_path, chunk)
+                        for chunk in islice(chunks, jobs * 2))
+        while pending:
+            chunk_pages = pending.popleft().result()
+            for chunk in islice(chunks, 1):
+                pending.append(executor.submit(extract_page_words, pdf_path, chunk))
+            yield from chunk_pages
+
+
+def iter_cached_pages(pdf_path, page_numbers, jobs=1, cache=None):
+    """Comme `iter_pages`, mais lit les pages déjà extraites depuis le cache disque.
+
+    Seules les pages absentes du cache passent par pdfplumber ; elles sont
+    enregistrées au fur et à mesure, puis le cache est ramené à sa taille maximale.
+    Une entrée supprimée ou illisible au moment de la lecture est ré-extraite.
+    """
+    if cache is None:
+        yield from iter_pages(pdf_path, page_numbers, jobs)
+        return
+
+    page_numbers = list(page_numbers)
+    missing = [page_num for page_num in page_numbers if not cache.has(page_num)]
+    missing_set = set(missing)
+    extracted = iter_pages(pdf_path, missing, jobs)
+    for page_num in page_numbers:
+        if page_num in missing_set:
+            page_words = next(extracted)
+            cache.store(page_num, page_words)
+        else:
+            page_words = cache.load(page_num)
+            if page_words is None:
+                page_words, = iter_page_words(pdf_path, [page_num])
+                cache.store(page_num, page_words)
+        yield page_words
+    cache.evict()
+
+
+def classify_pages(pages, font_sizes=DEFAULT_FONT_SIZES):
+    """Classe les mots page par page, sous forme de colonnes.
+
+    Pour chaque page, produit trois colonnes parallèles ``(texts, sizes,
+    line_breaks)`` : texte du mot, taille de police arrondie (ramenée à la
+    taille nominale du niveau si elle tombe dans une bande de titre du profil
+    `font_sizes`), et retour à la ligne après le mot. Le seul regard en avant
+    est le `doctop` du mot suivant, qui peut se trouver sur la page suivante :
+    une page n'est donc produite qu'une fois le premier mot de la page suivante connu.
+    """
+    snap = size_snap_map(font_sizes)
+    pending = None
+    for page_words in pages:
+        if not page_words:
+            continue
+        if pending is not None:
+            yield page_columns(pending, page_words[0][2], snap)
+        pending = page_words
+    if pending is not None:
+        yield page_columns(pending, None, snap)
+
+
+def page_columns(page_words, next_doctop, snap):
+    """Calcule les colonnes d'une page ; `next_doctop` est le `doctop` du mot qui suit la page."""
+    texts, sizes, doctops = zip(*page_words)
+    sizes = [snap.get(size, size) for size in map(round, sizes)]
+    # Retour à la ligne si l'écart de doctop avec le mot suivant est supérieur à 20
+    # diff entre deux lignes 14, entre deux paragraphes 25,9
+    line_breaks = [abs(following - doctop) > 20
+                   for doctop, following in zip(doctops, doctops[1:])]
+    line_breaks.append(next_doctop is not None and abs(next_doctop - doctops[-1]) > 20)
+    return texts, sizes, line_breaks
+
+
+def extract_text_elements(pdf_path, page_range, jobs=1, cache=None,
+                          font_sizes=DEFAULT_FONT_SIZES, keep_leading_text=False):
 
     # Ajuster la plage de pages pour l'indexage à partir de zéro
     adjusted_page_range = [page - 1 for page in page_range]
-    # Lire le fichier PDF
-    words = []
+    # Lire le fichier PDF page par page
+    pages = iter_cached_pages(pdf_path, adjusted_page_range, jobs, cache)
+    if profiling.active is not None and profiling.active.trace:
+        # Chaque page tracée avec sa lecture, sa classification et sa construction,
+        # bien que classify_pages lise la page suivante avant de la produire
+        columns = profiling.active.trace_pipeline(
+            pages, lambda pages: classify_pages(pages, font_sizes), "page",
+            [page + 1 for page in adjusted_page_range], words=len)
+    else:
+        columns = classify_pages(pages, font_sizes)
+    return build_text_elements(columns, font_sizes, keep_leading_text)
+
+
+def analyze_fonts(pdf_path, page_range, jobs=1, cache=None, samples=3):
+    """Histogramme des tailles de police arrondies, en un seul passage sur les pages.
+
+    Renvoie, pour chaque taille, un dictionnaire avec le nombre de mots, la
+    première page où elle apparaît et quelques exemples de texte. Sert à
+    calibrer le profil `font_sizes` d'un nouveau traité sans extraction complète.
+    """
+    counts = Counter()
+    first_pages = {}
+    examples = {}
+    for page, page_words in zip(page_range, iter_cached_pages(
+            pdf_path, [page - 1 for page in page_range], jobs, cache)):
+        for word_text, word_size, _ in page_words:
+            if not word_text.strip():
+                continue
+            size = round(word_size)
+            counts[size] += 1
+            first_pages.setdefault(size, page)
+            size_examples = examples.setdefault(size, [])
+            if len(size_examples) < samples:
+                size_examples.append(word_text.strip()[:40])
+    return {size: {"words": counts[size], "first_page": first_pages[size],
+                   "examples": examples[size]}
+            for size in sorted(counts, reverse=True)}
+
+
+def outline_pages(pages, font_sizes=DEFAULT_FONT_SIZES):
+    """Titres (Title, Title1, Chapter) du document, avec la page où chacun commence.
+
+    `pages` produit des couples (numéro de page, mots). Un titre est une suite de
+    mots à la taille d'un niveau, comme dans `build_text_elements` ; il peut se
+    poursuivre sur la page suivante. `chapter` est le numéro lu dans le titre
+    d'un chapitre.
+    """
+    snap = size_snap_map(font_sizes)
+    level_by_size = {font_sizes[level]: level for level in reversed(HEADING_LEVELS)}
+    headings = []
+    current = None
+    current_words = []
+
+    def close():
+        text = "".join(current_words).strip()
+        if text:
+            current["text"] = text
+            if current["level"] == "chapter":
+                current["chapter"] = extract_chapter_number(text)
+            headings.append(current)
+
+    for page, page_words in pages:
+        for word_text, word_size, _ in page_words:
+            if word_text == " ":
+                continue
+            size = round(word_size)
+            level = level_by_size.get(snap.get(size, size))
+            if current is not None and level != current["level"]:
+                close()
+                current = None
+            if level is not None:
+                if current is None:
+                    current = {"level": level, "page": page}
+                    current_words = []
+                current_words.append(word_text)
+    if current is not None:
+        close()
+    return headings
+
+
+def load_outline(pdf_path, font_sizes=DEFAULT_FONT_SIZES, jobs=1, cache=None,
+                 outline_dir=DEFAULT_OUTLINE_DIR, rebuild=False):
+    """Sommaire des pages du PDF, lu depuis le cache ou calculé en un passage sur toutes les pages.
+
+    Le sommaire est enregistré dans `outline_dir`, indexé par le hash du PDF, la
+    version de pdfplumber et le profil de tailles : il n'est recalculé que si
+    l'un des trois change.
+    """
+    key = cache.key if cache is not None else f"{file_hash(pdf_path)}_{pdfplumber.__version__}"
+    profile = hashlib.sha256(json.dumps(font_sizes, sort_keys=True).encode()).hexdigest()[:12]
+    path = Path(outline_dir) / f"{key}_{profile}.json"
+    if not rebuild and path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
     with pdfplumber.open(pdf_path) as pdf:
-        for page_num in adjusted_page_range:
-            page = pdf.pages[page_num]
-            words += page.extract_words(keep_blank_chars=True,
-                                        extra_attrs=["size"])
+        page_count = len(pdf.pages)
+    pages = iter_cached_pages(pdf_path, range(page_count), jobs, cache)
+    outline = {
+        "pages": page_count,
+        "headings": outline_pages(((index + 1, page_words) for index, page_words in enumerate(pages)),
+                                  font_sizes),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write(path, json.dumps(outline, ensure_ascii=False, indent=1).encode("utf-8"))
+    return outline
+
+
+def chapter_pages(outline, chapters):
+    """Pages (à partir de 1) à extraire pour obtenir en entier les chapitres numérotés `chapters`.
+
+    Un chapitre s'étend jusqu'au titre suivant, de n'importe quel niveau. La
+    page de ce titre est toujours incluse : même en haut de page, son premier
+    mot décide du retour à la ligne final du chapitre. Renvoie la liste triée
+    des pages et celle des numéros absents du sommaire.
+    """
+    wanted = set(chapters)
+    headings = outline["headings"]
+    pages = set()
+    found = set()
+    for position, heading in enumerate(headings):
+        if heading["level"] != "chapter" or heading.get("chapter") not in wanted:
+            continue
+        found.add(heading["chapter"])
+        end = headings[position + 1]["page"] if position + 1 < len(headings) else outline["pages"]
+        pages.update(range(heading["page"], end + 1))
+    return sorted(pages), sorted(wanted - found)
+
+
+def format_numbers(numbers):
+    """Nombres triés sous forme compacte, ex. [3, 4, 5, 9] → "3-5, 9"."""
+    runs = []
+    for number in numbers:
+        if runs and number == runs[-1][1] + 1:
+            runs[-1][1] = number
+        else:
+            runs.append([number, number])
+    return ", ".join(str(start) if start == end else f"{start}-{end}" for start, end in runs)
+
+
+def print_outline(outline):
+    """Affiche les titres page par page."""
+    indent = {"title": "", "title1": "  ", "chapter": "    "}
+    page = None
+    for heading in outline["headings"]:
+        if heading["page"] != page:
+            page = heading["page"]
+            print(f"p. {page}")
+        print(f"  {indent[heading['level']]}{heading['text']}")
+
+
+def print_font_report(histogram, font_sizes=DEFAULT_FONT_SIZES):
+    """Affiche l'histogramme des tailles, regroupées en clusters de tailles contiguës."""
+    snap = size_snap_map(font_sizes)
+    level_by_size = {font_sizes[level]: level for level in reversed(HEADING_LEVELS)}
+    cluster = 0
+    previous_size = None
+    print(f"{'cluster':>7} {'taille':>6} {'mots':>6} {'page':>5}  {'niveau':<8} exemples")
+    for size, info in histogram.items():
+        if previous_size is None or previous_size - size > 1:
+            cluster += 1
+        previous_size = size
+        level = level_by_size.get(snap.get(size), "")
+        examples = " | ".join(info["examples"])
+        print(f"{cluster:>7} {size:>6} {info['words']:>6} {info['first_page']:>5}  {level:<8} {examples}")
+
+
+def open_placeholders(title, title_1, chapter):
+    """Title1 et Chapter courants ; None désigne l'élément vide du parent, créé ici."""
+    if title_1 is None:
+        title_1 = title.titles_1_list[0]
+    if chapter is None:
+        chapter = title_1.chapter_list[0]
+    return title_1, chapter
+
+
+def build_text_elements(columns, font_sizes=DEFAULT_FONT_SIZES, keep_leading_text=False):
+    """Construit la hiérarchie Title → Title1 → Chapter → Paragraph à partir des colonnes classées.
+
+    Les textes en cours sont accumulés dans des listes et assemblés une seule
+    fois, à la création de l'élément correspondant.
+
+    Le texte qui précède le premier Title est abandonné, sauf avec
+    `keep_leading_text` : il est alors conservé sous un Title vide (extraction
+    de chapitres dont le Title est hors des pages lues).
+    """
+    title_size = font_sizes["title"]
+    title_1_size = font_sizes["title1"]
+    chapter_size = font_sizes["chapter"]
+
     titles = [Title("", 0)]
     current_title = titles[0]
-    current_title_text = ""
+    current_title_text = []
     title_index = 1
 
-    current_title_1 = current_title.titles_1_list[0]
-    current_title_1_text = ""
+    # None : le Title1 (ou Chapter) vide du parent, créé seulement s'il reçoit du contenu
+    current_title_1 = None
+    current_title_1_text = []
     title_1_index = 1
 
-    current_chapter = current_title.titles_1_list[0].chapter_list[0]
-    current_chapter_text = ""
+    current_chapter = None
+    current_chapter_text = []
     chapter_index = 1
 
-    text_content = ""
+    text_content = []
     previous_word_size = 0
-    word_text = ""
 
-    for i, word in enumerate(words):
-        word_text = word["text"]
-        if word_text != " ":
-            current_word_size = round(word["size"])
+    for texts, sizes, line_breaks in columns:
+        for word_text, current_word_size, line_break in zip(texts, sizes, line_breaks):
+            if word_text == " ":
+                continue
 
             # Set previous_word_size value on first run
             if previous_word_size == 0:
                 previous_word_size = current_word_size
 
             if current_word_size != previous_word_size:
-                if previous_word_size == current_title.SIZE:
-                    add_title(titles, current_title_text, len(titles))
+                if previous_word_size == title_size:
+                    add_title(titles, "".join(current_title_text), len(titles), keep_leading_text)
                     current_title = titles[-1]
-                    current_title_1 = current_title.titles_1_list[0]
-                    current_chapter = current_title.titles_1_list[0].chapter_list[0]
+                    current_title_1 = None
+                    current_chapter = None
                     title_index += 1
-                    current_title_text = ""
-                elif previous_word_size == current_title_1.SIZE:
-                    add_title1(current_title_1_text,
+                    current_title_text = []
+                elif previous_word_size == title_1_size:
+                    add_title1("".join(current_title_1_text),
                                title_1_index, current_title)
                     current_title_1 = current_title.titles_1_list[-1]
-                    current_chapter = current_title_1.chapter_list[0]
+                    current_chapter = None
                     title_1_index += 1
-                    current_title_1_text = ""
-                elif previous_word_size == current_chapter.SIZE:
-                    add_chapter(current_chapter_text,
+                    current_title_1_text = []
+                elif previous_word_size == chapter_size:
+                    if current_title_1 is None:
+                        current_title_1 = current_title.titles_1_list[0]
+                    add_chapter("".join(current_chapter_text),
                                 chapter_index, current_title_1)
                     current_chapter = current_title_1.chapter_list[-1]
                     chapter_index += 1
-                    current_chapter_text = ""
+                    current_chapter_text = []
                 else:
-                    create_and_append_paragraphs(text_content, current_chapter)
-                    text_content = ""
-
-            if current_word_size == current_title.SIZE:
-                current_title_text += word_text
-            elif current_word_size == current_title_1.SIZE:
-                current_title_1_text += word_text
-            elif current_word_size == current_chapter.SIZE:
-                current_chapter_text += word_text
+                    if text_content:
+                        current_title_1, current_chapter = open_placeholders(
+                            current_title, current_title_1, current_chapter)
+                        create_and_append_paragraphs("".join(text_content), current_chapter)
+                    text_content = []
+
+            if current_word_size == title_size:
+                current_title_text.append(word_text)
+            elif current_word_size == title_1_size:
+                current_title_1_text.append(word_text)
+            elif current_word_size == chapter_size:
+                current_chapter_text.append(word_text)
             else:
-                # Add a newline if the difference in doctop between the current and next word is greater than 3
-                # diff entre deux lignes 14, entre deux paragraphes 25,9
-                if (i < len(words) - 1 and abs(words[i + 1]["doctop"] - word["doctop"]) > 20):
-                    text_content += word_text
-                    text_content += "\n"
-                else:
-                    text_content += word_text
+                text_content.append(word_text)
+                if line_break:
+                    text_content.append("\n")
 
             previous_word_size = current_word_size
 
     # Taking account last paragraph of the last page
+    text_content = "".join(text_content)
     if text_content.split():
+        _, current_chapter = open_placeholders(current_title, current_title_1, current_chapter)
         create_and_append_paragraphs(text_content, current_chapter)
 
     return titles
@@ -169,44 +585,178 @@ def extract_chapter_number(title):
     return None
 
 def convert_to_yaml_structure(title_list, config, debug=False):
-    """Convertit la structure extraite en format YAML conforme"""
-    sections = []
-    
-    for title in title_list:
-        for title1 in title.titles_1_list:
-            for chapter in title1.chapter_list:
-                if not chapter.text or chapter.text.strip() == "":
-                    continue
-                
-                # Extraire le vrai numéro de chapitre depuis le titre
-                chapter_number = extract_chapter_number(chapter.text)
-                if chapter_number is None:
-                    chapter_number = chapter.index
-                
-                if debug:
-                    print(f"DEBUG - Titre: {chapter.text}")
-                    print(f"DEBUG - Chapter number extrait: {chapter_number}")
-                
-                # Fusionner tous les paragraphes avec des retours à la ligne
-                paragraphs_text = "\n".join([p.text for p in chapter.paragraph_list if p.text.strip()])
-                
-                section = {
-                    "id": f"{config['master_id']}_l{config['book']}_c{chapter_number}",
-                    "title": chapter.text,
-                    "metadata": {
-                        "master": config["master"],
-                        "work": config["work"],
-                        "book": config["book"],
-                        "chapter": chapter_number,
-                        "year": config["year"]
-                    },
-                    "content": {
-                        "fr": LiteralScalarString(paragraphs_text)
-                    }
-                }
-                sections.append(section)
-    
-    return sections
+    """Convertit la structure extraite en sections au format YAML conforme.
+
+    Générateur : les sections sont produites une à une, au fil du parcours de la
+    hiérarchie, et peuvent être écrites sans construire la liste complète.
+    """
+    for chapter in iter_chapters(title_list):
+        if not chapter.text or chapter.text.strip() == "":
+            continue
+
+        # Extraire le vrai numéro de chapitre depuis le titre
+        chapter_number = extract_chapter_number(chapter.text)
+        if chapter_number is None:
+            chapter_number = chapter.index
+
+        if debug:
+            print(f"DEBUG - Titre: {chapter.text}")
+            print(f"DEBUG - Chapter number extrait: {chapter_number}")
+
+        # Fusionner tous les paragraphes avec des retours à la ligne
+        paragraphs_text = "\n".join([p.text for p in chapter.paragraph_list if p.text.strip()])
+
+        yield {
+            "id": f"{config['master_id']}_l{config['book']}_c{chapter_number}",
+            "title": chapter.text,
+            "metadata": {
+                "master": config["master"],
+                "work": config["work"],
+                "book": config["book"],
+                "chapter": chapter_number,
+                "year": config["year"]
+            },
+            "content": {
+                "fr": LiteralScalarString(paragraphs_text)
+            }
+        }
+
+def output_path(config):
+    """Fichier YAML produit pour une entrée de PDF_MAPPING."""
+    return f"data/treatises/{config['master_id']}_opera_nova_livre{config['book']}.yaml"
+
+def write_sections(sections, output_filename):
+    """Écrit les sections dans le fichier YAML (écriture atomique). Renvoie leur nombre.
+
+    Chaque section est sérialisée comme un élément de la liste racine dès
+    qu'elle est produite, avec la configuration YAML de treatise_store
+    (`dump_section`) : une section est formatée de la même façon qu'elle soit
+    écrite ici, insérée par --merge ou réécrite par yaml_annotate. Le résultat
+    est identique à celui d'un `yaml.dump` de la liste complète, sans la
+    garder en mémoire.
+    """
+    count = 0
+    with atomic_open(output_filename) as f:
+        for section in sections:
+            f.write(dump_section(section))
+            count += 1
+        if not count:
+            setup_yaml().dump([], f)
+    return count
+
+def section_chapter(section_id):
+    """Numéro de chapitre lu dans un id de section (`..._c94`), ou None."""
+    match = re.search(r"_c(\d+)$", section_id or "")
+    return int(match.group(1)) if match else None
+
+
+def line_changes(old_text, new_text):
+    """Nombre de lignes ajoutées et supprimées entre deux textes."""
+    added = removed = 0
+    for line in difflib.ndiff(old_text.splitlines(), new_text.splitlines()):
+        if line.startswith("+ "):
+            added += 1
+        elif line.startswith("- "):
+            removed += 1
+    return added, removed
+
+
+def merge_sections(sections, output_filename, enricher=None):
+    """Fusionne les sections extraites dans le fichier YAML existant, d'après leur `id`.
+
+    Une section existante n'est réécrite que si son texte `fr` (ou son titre,
+    ses métadonnées) a changé ; ses autres champs (`it`, `en_versions`, `notes`,
+    `annotation`...) sont conservés. Le texte stocké a pu être enrichi par
+    `yaml-annotate` : avec `enricher`, les deux textes sont comparés une fois
+    enrichis. Les nouvelles sections sont insérées dans l'ordre des chapitres ;
+    les sections non extraites et les sections inchangées gardent leurs octets.
+
+    Renvoie le bilan : {"added": [id], "updated": {id: [champs]},
+    "unchanged": n, "kept": n, "changes": {id: (lignes +, lignes -)},
+    "written": fichier réécrit ou non}.
+    """
+    path = Path(output_filename)
+    if not path.exists() or path.read_bytes().strip() in (b"", b"[]"):
+        sections = list(sections)
+        write_sections(sections, output_filename)
+        return {"added": [section["id"] for section in sections], "updated": {},
+                "unchanged": 0, "kept": 0, "changes": {}, "written": True}
+
+    store = TreatiseStore(path)
+    normalize = enricher.enrich if enricher is not None else (lambda text: text)
+    # Positions de chaque id (un id répété est associé dans l'ordre de ses occurrences)
+    positions = {}
+    for position, section_id in enumerate(store.ids):
+        positions.setdefault(section_id, []).append(position)
+    matched = set()
+    summary = {"added": [], "updated": {}, "unchanged": 0, "kept": 0, "changes": {}}
+    previous = None
+
+    for section in sections:
+        candidates = positions.get(section["id"])
+        if candidates:
+            position = candidates.pop(0)
+            matched.add(position)
+            previous = position
+            # Comparaison sur une lecture rapide ; le chargement aller-retour
+            # (commentaires, styles) n'est fait que pour une section réécrite
+            existing = store.read_section(position)
+            old_text = normalize(str((existing.get("content") or {}).get("fr") or ""))
+            new_text = normalize(str(section["content"]["fr"]))
+            fields = []
+            if old_text != new_text:
+                summary["changes"][section["id"]] = line_changes(old_text, new_text)
+                fields.append("fr")
+            fields += [field for field in ("title", "metadata") if existing.get(field) != section[field]]
+            if fields:
+                existing = store.load_section(position)
+                for field in fields:
+                    if field == "fr":
+                        existing.setdefault("content", {})["fr"] = section["content"]["fr"]
+                    else:
+                        existing[field] = section[field]
+                store.replace_section(position, existing)
+                summary["updated"][section["id"]] = fields
+            else:
+                summary["unchanged"] += 1
+            continue
+
+        # Nouvelle section : avant le premier chapitre de numéro supérieur,
+        # ou à défaut après la section extraite précédente
+        chapter = section_chapter(section["id"])
+        position = None
+        if chapter is not None:
+            position = next((index for index, section_id in enumerate(store.ids)
+                             if (section_chapter(section_id) or -1) > chapter), None)
+        if position is None:
+            position = previous + 1 if previous is not None else len(store)
+        store.insert_section(position, section)
+        # Décaler les positions déjà connues
+        matched = {index + 1 if index >= position else index for index in matched}
+        for indexes in positions.values():
+            indexes[:] = [index + 1 if index >= position else index for index in indexes]
+        matched.add(position)
+        previous = position
+        summary["added"].append(section["id"])
+
+    summary["kept"] = len(store) - len(matched)
+    summary["written"] = store.save()
+    return summary
+
+
+def print_merge_summary(summary):
+    """Affiche le bilan de `merge_sections`, une ligne par section ajoutée ou modifiée."""
+    for section_id in summary["added"]:
+        print(f"  + {section_id}")
+    for section_id, fields in summary["updated"].items():
+        detail = ", ".join(fields)
+        if section_id in summary["changes"]:
+            added, removed = summary["changes"][section_id]
+            detail += f" (+{added}/-{removed} lignes)"
+        print(f"  ~ {section_id} : {detail}")
+    print(f"Sections : {len(summary['added'])} ajoutées, {len(summary['updated'])} modifiées, "
+          f"{summary['unchanged']} inchangées, {summary['kept']} non extraites conservées")
+
 
 def parse_page_range(input_str):
     try:
@@ -253,37 +803,11 @@ Exemples d'utilisation:
   uv run extract-book marozzo --pages "34-102"
   uv run extract-book manciolino --pages "1-50"
   uv run extract-book marozzo_l2 --pages "20"
+  uv run extract-book marozzo --chapters "94-120" --merge
+  uv run extract-book marozzo --outline
         """
     )
     
-    # Mapping des auteurs/livres vers leurs fichiers PDF et métadonnées
-    PDF_MAPPING = {
-        "marozzo": {
-            "pdf": "data/treatises/Achille Marozzo - opéra nova.pdf",
-            "master": "Achille Marozzo",
-            "master_id": "achille_marozzo",
-            "work": "Opera Nova",
-            "book": 1,
-            "year": 1536
-        },
-        "marozzo_l2": {
-            "pdf": "data/treatises/Achille Marozzo - opéra nova - livre 2.pdf",
-            "master": "Achille Marozzo",
-            "master_id": "achille_marozzo",
-            "work": "Opera Nova",
-            "book": 2,
-            "year": 1536
-        },
-        "manciolino": {
-            "pdf": "data/treatises/Antonio Manciolino - opéra nova.pdf",
-            "master": "Antonio Manciolino",
-            "master_id": "antonio_manciolino",
-            "work": "Opera Nova",
-            "book": 1,
-            "year": 1531
-        },
-    }
-    
     parser.add_argument(
         "author",
         type=str,
@@ -294,48 +818,195 @@ Exemples d'utilisation:
     parser.add_argument(
         "--pages",
         type=str,
-        required=True,
         help="Plage de pages à extraire (ex: 32-65 ou 32,34,60,63)"
     )
+
+    parser.add_argument(
+        "--chapters",
+        type=str,
+        help="Chapitres à extraire (ex: 94-120), d'après le sommaire des pages du PDF, au lieu de --pages"
+    )
+
+    parser.add_argument(
+        "--outline",
+        action="store_true",
+        help="Afficher le sommaire du PDF (titres et chapitres de chaque page) sans extraire"
+    )
+
+    parser.add_argument(
+        "--analyze-fonts",
+        action="store_true",
+        help="Afficher l'histogramme des tailles de police (toutes les pages si --pages est omis) sans extraire"
+    )
     
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Nombre de processus pour l'extraction des pages (défaut : 1)"
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ne pas utiliser le cache des mots extraits (data/.cache/words)"
+    )
+
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Ignorer les entrées existantes du cache (mots et sommaire) et les réécrire"
+    )
+
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="Fusionner dans le fichier YAML existant (d'après l'id des sections) au lieu de l'écraser"
+    )
+
+    parser.add_argument(
+        "--glossary",
+        default="data/glossary.yaml",
+        help="Avec --merge, glossaire utilisé pour comparer les textes déjà enrichis (défaut : data/glossary.yaml)"
+    )
+
     parser.add_argument(
         "--debug",
         action="store_true",
         help="Afficher les informations de debug"
     )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Afficher à la fin le temps et le nombre d'appels de chaque étape (pdfplumber, classification, regex, dump YAML...)"
+    )
+
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Avec le profil, mesurer aussi le pic de mémoire allouée par chaque étape (plus lent)"
+    )
+
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        help="Enregistrer aussi un profil cProfile (.prof) de toute l'exécution dans ce fichier"
+    )
+
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Afficher le temps passé sur chaque page"
+    )
     
     args = parser.parse_args()
-    
+    if args.pages is not None and args.chapters is not None:
+        parser.error("--pages et --chapters sont incompatibles")
+    if args.pages is None and args.chapters is None and not (args.analyze_fonts or args.outline):
+        parser.error("l'argument --pages (ou --chapters) est requis")
+
+    with profiling.session(profiled_stages(), args.profile, args.profile_memory,
+                           args.profile_output, args.trace):
+        run(args)
+
+def profiled_stages():
+    """Étapes chronométrées par --profile et --trace, voir scripts/profiling.py."""
+    module = sys.modules[__name__]
+    return [
+        (module, "iter_pages", "read PDF (pdfplumber)"),
+        (WordCache, "load", "cache: read"),
+        (WordCache, "store", "cache: write"),
+        (module, "page_columns", "classify sizes"),
+        (module, "load_outline", "page outline"),
+        (module, "build_text_elements", "build hierarchy"),
+        (module, "create_and_append_paragraphs", "split paragraphs"),
+        (module, "convert_to_yaml_structure", "convert to sections"),
+        (module, "write_sections", "write YAML (ruamel)"),
+        (module, "merge_sections", "merge into treatise"),
+    ]
+
+def run(args):
     config = PDF_MAPPING[args.author]
     pdf_path = config["pdf"]
+    font_sizes = config.get("font_sizes", DEFAULT_FONT_SIZES)
     search_range = args.pages
 
-    page_range = parse_page_range(search_range)
+    cache = None
+    if not args.no_cache:
+        cache = WordCache(pdf_path, rebuild=args.rebuild_cache)
+
+    if args.analyze_fonts:
+        if search_range is None:
+            with pdfplumber.open(pdf_path) as pdf:
+                page_range = range(1, len(pdf.pages) + 1)
+        else:
+            page_range = parse_page_range(search_range)
+        histogram = analyze_fonts(pdf_path, page_range, jobs=args.jobs, cache=cache)
+        print_font_report(histogram, font_sizes)
+        return
+
+    if args.outline:
+        print_outline(load_outline(pdf_path, font_sizes, args.jobs, cache, rebuild=args.rebuild_cache))
+        return
+
+    chapters = None
+    if args.chapters is not None:
+        chapters = set(parse_page_range(args.chapters))
+        if not chapters:
+            print("Plage de chapitres invalide !")
+            return
+        outline = load_outline(pdf_path, font_sizes, args.jobs, cache, rebuild=args.rebuild_cache)
+        page_range, missing = chapter_pages(outline, chapters)
+        if missing:
+            print(f"Chapitres absents du sommaire : {format_numbers(missing)}")
+        if not page_range:
+            print("Aucun chapitre à extraire.")
+            return
+        print(f"Chapitres {args.chapters} : pages {format_numbers(page_range)}")
+    else:
+        page_range = parse_page_range(search_range)
     if not page_range:
         print("Plage invalide !")
     else:
-        title_list = extract_text_elements(pdf_path, page_range)
+        title_list = extract_text_elements(pdf_path, page_range,
+                                           jobs=args.jobs, cache=cache,
+                                           font_sizes=font_sizes,
+                                           keep_leading_text=chapters is not None)
 
-        # Debug: Afficher la structure extraite
+        # Debug: Afficher la structure extraite (sans créer les éléments vides, voir iter_chapters)
         for title in title_list:
             print(f"Titre: {title.text}")            
-            for title1 in title.titles_1_list:
+            for title1 in title._titles_1_list or ():
                 print(f"  Titre1: {title1.text}")
-                for chapter in title1.chapter_list:
+                for chapter in title1._chapter_list or ():
                     print(f"    Chapitre: {chapter.text}")
                     for paragraph in chapter.paragraph_list:
                         print(f"      Paragraphe: {paragraph.text}")                
 
-        # Convertir en structure YAML
+        # Convertir en structure YAML et sauvegarder, section par section
         sections = convert_to_yaml_structure(title_list, config, debug=args.debug)
+        if chapters is not None:
+            # Les pages extraites peuvent contenir le début ou la fin d'autres chapitres
+            sections = (section for section in sections
+                        if extract_chapter_number(section["title"]) in chapters)
+        output_filename = output_path(config)
+        if args.merge:
+            enricher = None
+            if Path(args.glossary).exists():
+                enricher = TextEnricher(load_glossary(args.glossary))
+            summary = merge_sections(sections, output_filename, enricher)
+            if summary["written"]:
+                print(f"Fichier YAML mis à jour : {output_filename}")
+            else:
+                print(f"Fichier YAML inchangé : {output_filename}")
+            print_merge_summary(summary)
+            return
 
-        # Sauvegarder dans le fichier YAML
-        output_filename = f"data/treatises/{config['master_id']}_opera_nova_livre{config['book']}.yaml"
-        with open(output_filename, 'w', encoding='utf-8') as f:            
-            yaml.dump(sections, f)
+        section_count = write_sections(sections, output_filename)
 
         print(f"Fichier YAML généré : {output_filename}")
-        print(f"Nombre de sections : {len(sections)}")
+        print(f"Nombre de sections : {section_count}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,241 @@
+"""Instrumentation des étapes de `extract_book` et `yaml_annotate`.
+
+Chaque étape nommée correspond à une fonction (ou méthode) existante. Lorsqu'une
+session est ouverte (`--profile`, `--trace`), ces fonctions sont remplacées le
+temps de la session par des versions qui comptent les appels, le temps réel
+écoulé et, avec `--profile-memory`, le pic de mémoire allouée (tracemalloc).
+Hors session, rien n'est remplacé : l'instrumentation ne coûte rien.
+
+Les temps sont inclusifs : une étape appelée depuis une autre est comptée dans
+les deux. Pour une fonction génératrice, un « appel » est un élément produit,
+et le temps est celui passé à produire les éléments.
+
+`--profile-output` enregistre en plus un profil cProfile complet (.prof),
+lisible avec `python -m pstats`, snakeviz, ou converti en flamegraph (flameprof).
+
+Le mode trace affiche au fil de l'eau le temps passé sur chaque élément (page
+d'un PDF, section d'un traité), puis les éléments les plus lents.
+"""
+import cProfile
+import functools
+import inspect
+import sys
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+# Session en cours (None : instrumentation désactivée)
+active = None
+
+
+class StageStats:
+    __slots__ = ("calls", "seconds", "peak_bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.peak_bytes = 0
+
+
+class Profiler:
+    """Statistiques par étape et traces d'une session d'instrumentation."""
+
+    def __init__(self, memory=False, trace=False, out=sys.stderr):
+        self.memory = memory
+        self.trace = trace
+        self.out = out
+        self.stats = {}
+        self.traces = []
+        self._stack = []
+        self._patches = []
+
+    # Mesure
+
+    def _enter(self):
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current, 0])
+        return time.perf_counter()
+
+    def _exit(self, name, start, counted=True):
+        elapsed = time.perf_counter() - start
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = StageStats()
+        stats.seconds += elapsed
+        stats.calls += counted
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            start_bytes, child_peak = self._stack.pop()
+            peak = max(peak, child_peak)
+            stats.peak_bytes = max(stats.peak_bytes, peak - start_bytes)
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+        return elapsed
+
+    def wrap(self, func, name, label=None):
+        """Version chronométrée de `func`. `label(*args, **kwargs)` nomme l'appel dans la trace."""
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                items = func(*args, **kwargs)
+                while True:
+                    start = self._enter()
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        self._exit(name, start, counted=False)
+                        return
+                    except BaseException:
+                        self._exit(name, start)
+                        raise
+                    self._exit(name, start)
+                    yield item
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = self._enter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = self._exit(name, start)
+                if self.trace and label is not None:
+                    self.log(name, label(*args, **kwargs), elapsed)
+        return wrapper
+
+    def instrument(self, owner, attribute, name, label=None):
+        """Remplace `owner.attribute` (fonction de module ou méthode de classe) jusqu'à `restore`."""
+        original = owner.__dict__[attribute] if isinstance(owner, type) else getattr(owner, attribute)
+        self._patches.append((owner, attribute, original))
+        setattr(owner, attribute, self.wrap(original, name, label))
+
+    def restore(self):
+        for owner, attribute, original in reversed(self._patches):
+            setattr(owner, attribute, original)
+        self._patches = []
+
+    # Trace
+
+    def log(self, name, label, seconds, **details):
+        """Enregistre et affiche la durée d'un élément (page, section...)."""
+        self.traces.append((name, label, seconds, details))
+        extra = "".join(f", {key} {value}" for key, value in details.items())
+        print(f"[trace] {name} {label}: {seconds * 1000:.2f} ms{extra}", file=self.out, flush=True)
+
+    def trace_pipeline(self, items, stage, name, labels, **measures):
+        """
+        Itère sur `stage(items)` en chronométrant chaque élément de `items` sur sa
+        propre ligne : sa lecture, puis le travail de `stage` pour produire le
+        résultat correspondant et celui du consommateur avant de demander le suivant.
+
+        `stage` produit, dans l'ordre, un résultat par élément non vide et peut
+        lire des éléments d'avance : leur lecture n'est pas comptée dans le
+        traitement du résultat en cours. Un élément vide est tracé avec sa seule lecture.
+        `measures` associe un nom affiché à une fonction appliquée à l'élément (ex. mots=len).
+        """
+        labels = iter(labels)
+        # Éléments lus dont le résultat n'est pas encore produit : (label, lecture, mesures, vide)
+        pending = deque()
+        reading = [0.0]
+
+        def read():
+            source = iter(items)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(source)
+                except StopIteration:
+                    return
+                elapsed = time.perf_counter() - start
+                reading[0] += elapsed
+                pending.append((next(labels, "?"), elapsed,
+                                {key: measure(item) for key, measure in measures.items()}, not item))
+                yield item
+
+        def log(label, read_seconds, details, processing=0.0):
+            self.log(name, label, read_seconds + processing,
+                     read=f"{read_seconds * 1000:.2f} ms",
+                     processing=f"{processing * 1000:.2f} ms", **details)
+
+        results = stage(read())
+        while True:
+            reading[0] = 0.0
+            start = time.perf_counter()
+            try:
+                result = next(results)
+            except StopIteration:
+                break
+            produced = time.perf_counter()
+            yield result
+            consumed = time.perf_counter()
+            while pending and pending[0][3]:
+                log(*pending.popleft()[:3])
+            if pending:
+                label, read_seconds, details, _ = pending.popleft()
+                log(label, read_seconds, details, produced - start - reading[0] + consumed - produced)
+        for label, read_seconds, details, _ in pending:
+            log(label, read_seconds, details)
+
+    # Rapport
+
+    def report(self, total_seconds, slowest=5):
+        out = self.out
+        print(f"\n{'stage':<36} {'calls':>8} {'total (s)':>10} {'avg (ms)':>10} {'% total':>8}"
+              + (f" {'peak mem (MB)':>14}" if self.memory else ""), file=out)
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].seconds):
+            average = stats.seconds / stats.calls * 1000 if stats.calls else 0.0
+            share = stats.seconds / total_seconds if total_seconds else 0.0
+            line = f"{name:<36} {stats.calls:>8} {stats.seconds:>10.3f} {average:>10.2f} {share:>8.1%}"
+            if self.memory:
+                line += f" {stats.peak_bytes / 1024 / 1024:>14.1f}"
+            print(line, file=out)
+        print(f"{'total time':<36} {'':>8} {total_seconds:>10.3f}", file=out)
+
+        if self.traces:
+            print("\nSlowest items:", file=out)
+            for name, label, seconds, _ in sorted(self.traces, key=lambda row: -row[2])[:slowest]:
+                print(f"  {seconds * 1000:>10.2f} ms  {name} {label}", file=out)
+
+
+@contextmanager
+def session(stages, profile=False, memory=False, output=None, trace=False, out=sys.stderr):
+    """
+    Ouvre une session d'instrumentation autour d'une exécution complète.
+
+    `stages` est une liste de (objet, attribut, nom de l'étape[, label]) ; sans
+    aucune option, rien n'est instrumenté et la session ne fait rien.
+    """
+    global active
+    if not (profile or memory or output or trace):
+        yield None
+        return
+
+    profiler = Profiler(memory=memory, trace=trace, out=out)
+    for owner, attribute, name, *label in stages:
+        profiler.instrument(owner, attribute, name, *label)
+    if memory:
+        tracemalloc.start()
+    c_profile = cProfile.Profile() if output else None
+    active = profiler
+    start = time.perf_counter()
+    try:
+        if c_profile:
+            c_profile.enable()
+        yield profiler
+    finally:
+        if c_profile:
+            c_profile.disable()
+        total = time.perf_counter() - start
+        active = None
+        profiler.restore()
+        if memory:
+            tracemalloc.stop()
+        profiler.report(total)
+        if c_profile:
+            c_profile.dump_stats(output)
+            print(f"cProfile profile saved to {output}", file=out)
@@ -0,0 +1,240 @@
+"""
+Publish one compressed, glossary-resolved JSON shard per treatise section.
+
+The reader UI otherwise re-scans every section text for `{glossary_key}` tokens
+on each page view and joins them against the whole glossary, and the API routes
+parse a whole YAML file to serve one section. This stage does that work once:
+a shard holds one section with its text fields split into segments (plain
+strings and {"key": ...} references, exactly as TextParser splits them) and the
+glossary entries the section references, gzip-compressed.
+
+Shard file names contain the hash of their content, so a shard never changes
+once published and can be cached forever. manifest.json maps each section id
+to its current shard and is the only file a client has to revalidate.
+
+Publishing is incremental: a section is re-published only when its YAML block
+or one of the glossary entries it references changed. Other sections are not
+even parsed.
+
+Usage (from the spadalibreria/ folder):
+    uv run publish-shards
+    uv run publish-shards --force
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+
+from scripts.corpus_index import DEFAULT_GLOSSARY, DEFAULT_TREATISES_DIR
+from scripts.treatise_store import TreatiseStore, atomic_write, setup_reader
+
+DEFAULT_OUTPUT_DIR = "public/shards"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Same split as the front end (MarkdownRenderer): "{key}" is a glossary reference
+TOKEN_RE = re.compile(r'(\{[^}]+\})')
+UNSAFE_FILENAME_RE = re.compile(r'[^\w.-]+')
+
+
+def tokenize(text):
+    """Split a text into plain strings and {"key": ...} glossary references."""
+    segments = []
+    for index, part in enumerate(TOKEN_RE.split(text)):
+        if index % 2:
+            segments.append({"key": part[1:-1]})
+        elif part:
+            segments.append(part)
+    return segments
+
+
+def tokenize_content(content):
+    """
+    Copy of a section's content with every text field tokenized
+    (fr, it, notes... and en_versions[].text). Returns (content, referenced keys).
+    """
+    keys = {}
+
+    def segments(text):
+        result = tokenize(text)
+        for segment in result:
+            if isinstance(segment, dict):
+                keys.setdefault(segment["key"], None)
+        return result
+
+    tokenized = {}
+    for field, value in content.items():
+        if isinstance(value, str):
+            value = segments(value)
+        elif field == "en_versions" and isinstance(value, list):
+            value = [{**version, "text": segments(version["text"])}
+                     if isinstance(version, dict) and isinstance(version.get("text"), str) else version
+                     for version in value]
+        tokenized[field] = value
+    return tokenized, list(keys)
+
+
+def entry_hash(entry):
+    """Hash of a glossary entry, or None for a key missing from the glossary."""
+    if entry is None:
+        return None
+    return hashlib.sha256(
+        json.dumps(entry, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+
+
+def build_shard(section, glossary):
+    """
+    Shard of one section: the section with tokenized content, plus the glossary
+    entries it references. Keys missing from the glossary are left unresolved,
+    the reader shows them as is. Returns (shard, {key: entry hash}).
+    """
+    content, keys = tokenize_content(section.get("content") or {})
+    shard = {**section, "content": content,
+             "glossary": {key: glossary[key] for key in keys if key in glossary}}
+    return shard, {key: entry_hash(glossary.get(key)) for key in keys}
+
+
+def encode_shard(shard):
+    """
+    Compact JSON, gzip-compressed without timestamp: same shard, same bytes.
+    Returns (SHA-256 of the JSON, compressed bytes).
+    """
+    data = json.dumps(shard, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    return hashlib.sha256(data).hexdigest(), gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def shard_filename(section_id, digest):
+    return f"{UNSAFE_FILENAME_RE.sub('_', section_id)}.{digest[:16]}.json.gz"
+
+
+def load_manifest(output_dir):
+    """Manifest of the last run, or None if it is missing or from another version."""
+    try:
+        with open(Path(output_dir) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def publish(treatises_dir=DEFAULT_TREATISES_DIR, glossary_path=DEFAULT_GLOSSARY,
+            output_dir=DEFAULT_OUTPUT_DIR, force=False):
+    """
+    Bring the shards and their manifest up to date with the YAML sources.
+
+    The manifest records, for each section id: the shard file, the SHA-256 of
+    its uncompressed JSON (usable as an ETag), its compressed size, the source
+    file and the hash of the section block, and the hash of every glossary
+    entry the section references.
+    Returns {"published": [...], "unchanged": n, "removed": [...], "duplicates": [...]}.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    previous = None if force else load_manifest(output_dir)
+    previous_entries = previous['sections'] if previous else {}
+
+    glossary_path = Path(glossary_path)
+    glossary = (setup_reader().load(glossary_path.read_bytes()) or {}) if glossary_path.exists() else {}
+    glossary_hashes = {}
+
+    def current_hash(key):
+        if key not in glossary_hashes:
+            glossary_hashes[key] = entry_hash(glossary.get(key))
+        return glossary_hashes[key]
+
+    entries = {}
+    summary = {"published": [], "unchanged": 0, "removed": [], "duplicates": []}
+    for path in sorted(Path(treatises_dir).glob("*.yaml")):
+        store = TreatiseStore(path)
+        for position, section_id in enumerate(store.ids):
+            if section_id is None:
+                continue
+            if section_id in entries:
+                summary["duplicates"].append(f"{section_id} ({path})")
+                continue
+            block_hash = store.block_hash(position)
+            entry = previous_entries.get(section_id)
+            if (entry and entry.get('block') == block_hash and entry.get('source') == str(path)
+                    and all(current_hash(key) == value for key, value in entry['terms'].items())
+                    and (output_dir / entry['file']).exists()):
+                entries[section_id] = entry
+                summary["unchanged"] += 1
+                continue
+
+            shard, terms = build_shard(store.read_section(position), glossary)
+            digest, data = encode_shard(shard)
+            filename = shard_filename(section_id, digest)
+            if not (output_dir / filename).exists():
+                atomic_write(output_dir / filename, data)
+            entries[section_id] = {
+                'file': filename,
+                'sha256': digest,
+                'bytes': len(data),
+                'source': str(path),
+                'block': block_hash,
+                'terms': terms,
+            }
+            summary["published"].append(section_id)
+
+    summary["removed"] = [section_id for section_id in previous_entries if section_id not in entries]
+    manifest = {'version': MANIFEST_VERSION, 'sections': entries}
+    if manifest != previous:
+        atomic_write(output_dir / MANIFEST_NAME,
+                     json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8'))
+
+    # Shards no longer referenced, written only after the new manifest
+    referenced = {entry['file'] for entry in entries.values()}
+    for path in output_dir.glob("*.json.gz"):
+        if path.name not in referenced:
+            path.unlink()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Publish one compressed, glossary-resolved JSON shard per treatise section for the reader UI."
+    )
+    parser.add_argument(
+        "--treatises",
+        default=DEFAULT_TREATISES_DIR,
+        help=f"Folder of treatise YAML files (default: {DEFAULT_TREATISES_DIR})."
+    )
+    parser.add_argument(
+        "--glossary",
+        default=DEFAULT_GLOSSARY,
+        help=f"Path to the glossary YAML file (default: {DEFAULT_GLOSSARY})."
+    )
+    parser.add_argument(
+        "--output",
+        default=DEFAULT_OUTPUT_DIR,
+        help=f"Folder of the shards and their manifest (default: {DEFAULT_OUTPUT_DIR})."
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-publish every section, ignoring the manifest of the last run."
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = publish(args.treatises, args.glossary, args.output, args.force)
+
+    for section_id in summary["published"]:
+        print(f"  published {section_id}")
+    for section_id in summary["removed"]:
+        print(f"  removed {section_id}")
+    for duplicate in summary["duplicates"]:
+        print(f"  skipped duplicate id {duplicate}")
+    print(f"Shards {args.output}: {len(summary['published'])} published, "
+          f"{summary['unchanged']} unchanged, {len(summary['removed'])} removed "
+          f"({time.perf_counter() - start:.2f}s).")
+
+
+if __name__ == "__main__":
+    main()
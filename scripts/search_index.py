@@ -0,0 +1,451 @@
+"""
+Full-text inverted index over the treatise corpus, with a query CLI.
+
+Each section is one document. Its title, `content.it`, `content.fr`,
+`content.en_versions[].text` and `content.notes` are tokenized, accent-folded
+and lightly stemmed (per language), and stored as positional postings. Glossary
+references (`{key}`) are indexed both as the words of the glossary term and as a
+`glossary:<key>` token; annotation fields (guards_mentioned, strikes, weapons...)
+are indexed as `<field>:<value>` tokens.
+
+The index lives in a SQLite file built from the corpus snapshot (see
+corpus_index.py) and is rebuilt only when the snapshot's sources change. A
+query only reads the postings of its own terms.
+
+Query syntax:
+    mandritto falso              both words (implicit AND)
+    mandritto OR roverso         either word
+    mandritto NOT falso          first without the second
+    "porta di ferro"             phrase (consecutive words)
+    mandr*                       prefix
+    glossary:porta_di_ferro_larga
+    guards_mentioned:"coda longa e stretta"
+    (mandritto OR roverso) AND "coda longa"
+
+Usage (from the spadalibreria/ folder):
+    uv run search '"porta di ferro" AND mandritto'
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import time
+import unicodedata
+from pathlib import Path
+
+from scripts.corpus_index import (
+    DEFAULT_GLOSSARY, DEFAULT_INDEX_PATH, DEFAULT_TREATISES_DIR, CorpusIndex,
+)
+
+DEFAULT_SEARCH_INDEX = "data/.cache/search.sqlite"
+SCHEMA_VERSION = 1
+
+# Gap between the positions of two fields of a section, so phrases never span fields
+FIELD_GAP = 1_000_000
+
+# Annotation fields indexed as <field>:<value> tokens
+ANNOTATION_FIELDS = ("guards_mentioned", "techniques", "strikes", "targets",
+                     "weapons", "weapon_type", "measures", "strategy")
+
+# Light stemmers: the first matching suffix is removed if at least 3 characters remain
+SUFFIXES = {
+    "fr": ("issements", "issement", "ements", "ement", "ations", "ation",
+           "ees", "es", "ee", "s", "e"),
+    "it": ("amente", "mente", "azioni", "azione", "ioni", "ione",
+           "i", "e", "o", "a"),
+    "en": ("ings", "ing", "edly", "ed", "es", "s"),
+}
+LANGUAGES = tuple(SUFFIXES)
+
+TOKEN_RE = re.compile(r'\{([^{}\n]*)\}|\w+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY,
+    section_id TEXT NOT NULL,
+    file TEXT NOT NULL,
+    fields TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+
+def fold(text):
+    """Lower-case and strip accents: 'Épée' -> 'epee'."""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def stem(token, language):
+    """Remove the first matching inflection suffix of the language."""
+    for suffix in SUFFIXES[language]:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def field_token(field, value):
+    """Token used for an annotation or glossary value, e.g. weapons:spada_sola."""
+    return f"{field}:{'_'.join(fold(str(value)).split())}"
+
+
+def tokenize(text, language, glossary_terms):
+    """
+    Yield (token, char_offset) for each word of the text, in order.
+    A {key} tag yields a glossary:<key> token followed by the words of the glossary term.
+    """
+    for match in TOKEN_RE.finditer(text):
+        key = match.group(1)
+        if key is None:
+            yield stem(fold(match.group(0)), language), match.start()
+            continue
+        yield field_token("glossary", key), None
+        for word in re.findall(r'\w+', glossary_terms.get(key, key.replace('_', ' '))):
+            yield stem(fold(word), language), match.start()
+
+
+def section_fields(section):
+    """Yield (field name, language, text) for every indexed text of a section."""
+    if isinstance(section.get("title"), str):
+        yield "title", "fr", section["title"]
+    content = section.get("content") or {}
+    for name, language in (("it", "it"), ("fr", "fr"), ("notes", "fr")):
+        if isinstance(content.get(name), str):
+            yield name, language, content[name]
+    for version in content.get("en_versions") or []:
+        if isinstance(version.get("text"), str):
+            yield f"en:{version.get('translator', '')}", "en", version["text"]
+
+
+def annotation_tokens(section):
+    """Yield the <field>:<value> tokens of a section's annotation."""
+    annotation = section.get("annotation") or {}
+    for field in ANNOTATION_FIELDS:
+        value = annotation.get(field)
+        if isinstance(value, dict):
+            values = value.keys()
+        elif isinstance(value, list):
+            values = value
+        elif value:
+            values = [value]
+        else:
+            values = []
+        for item in values:
+            yield field_token(field, item)
+
+
+class SearchIndex:
+    """Build and query the positional inverted index."""
+
+    def __init__(self, path=DEFAULT_SEARCH_INDEX):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row and row[0]
+
+    # Building
+
+    @staticmethod
+    def corpus_signature(corpus):
+        """Hash of the corpus sources, to know whether the index is stale."""
+        rows = corpus.db.execute("SELECT path, sha256 FROM sources ORDER BY path").fetchall()
+        return hashlib.sha256(json.dumps([SCHEMA_VERSION, rows]).encode()).hexdigest()
+
+    def is_stale(self, corpus):
+        return self._meta("corpus") != self.corpus_signature(corpus)
+
+    def build(self, corpus):
+        """Rebuild the whole index from the corpus snapshot."""
+        glossary_terms = {key: entry.get("term") or key
+                          for key, entry in corpus.glossary().items()}
+        postings = {}
+        docs = []
+        for doc_id, (file, section) in enumerate(corpus.iter_sections()):
+            fields = []
+
+            def add(token, position):
+                postings.setdefault(token, {}).setdefault(doc_id, []).append(position)
+
+            for field_number, (name, language, text) in enumerate(section_fields(section)):
+                base = field_number * FIELD_GAP
+                offsets = []
+                for token, char_offset in tokenize(text, language, glossary_terms):
+                    if char_offset is None:
+                        # glossary:<key> shares the position of the term's first word
+                        add(token, base + len(offsets))
+                        continue
+                    add(token, base + len(offsets))
+                    offsets.append(char_offset)
+                fields.append({"name": name, "base": base, "text": text, "offsets": offsets})
+
+            annotation_position = (len(fields) + 1) * FIELD_GAP
+            for token in annotation_tokens(section):
+                add(token, annotation_position)
+            docs.append((doc_id, str(section.get("id")), file,
+                         json.dumps(fields, ensure_ascii=False)))
+
+        with self.db:
+            self.db.execute("DELETE FROM docs")
+            self.db.execute("DELETE FROM postings")
+            self.db.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", docs)
+            self.db.executemany(
+                "INSERT INTO postings VALUES (?, ?)",
+                [(token, json.dumps([[doc_id, positions] for doc_id, positions in by_doc.items()]))
+                 for token, by_doc in postings.items()])
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('corpus', ?)",
+                            (self.corpus_signature(corpus),))
+        return len(docs), len(postings)
+
+    # Querying
+
+    def postings(self, token):
+        """Return {doc_id: [positions]} for one exact token."""
+        row = self.db.execute("SELECT data FROM postings WHERE term = ?", (token,)).fetchone()
+        return {doc_id: positions for doc_id, positions in json.loads(row[0])} if row else {}
+
+    def prefix_postings(self, prefix):
+        """Return {doc_id: [positions]} merged over every token starting with prefix."""
+        merged = {}
+        rows = self.db.execute("SELECT data FROM postings WHERE term >= ? AND term < ?",
+                               (prefix, prefix + '\U0010ffff'))
+        for (data,) in rows:
+            for doc_id, positions in json.loads(data):
+                merged.setdefault(doc_id, []).extend(positions)
+        return merged
+
+    def search(self, query, limit=20):
+        """Run a query and return a list of hits (section_id, field, snippet), best first."""
+        matches = evaluate(parse_query(query), self)
+        ranked = sorted(matches.items(), key=lambda item: (-len(item[1]), item[0]))[:limit]
+        hits = []
+        for doc_id, positions in ranked:
+            section_id, fields = self.db.execute(
+                "SELECT section_id, fields FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+            field, snippet_text = snippet(json.loads(fields), min(positions, default=0))
+            hits.append((section_id, field, snippet_text))
+        return hits
+
+
+def snippet(fields, position, width=60):
+    """
+    Text around the word at `position`, with the field it belongs to.
+    Matches outside the texts (annotation fields, NOT clauses) show the start of the first field.
+    """
+    for field in fields:
+        index = position - field["base"]
+        if 0 <= index < len(field["offsets"]):
+            start = field["offsets"][index]
+            break
+    else:
+        if not fields:
+            return "annotation", ""
+        field, start = fields[0], 0
+    text = field["text"]
+    left = max(0, start - width)
+    right = min(len(text), start + width)
+    excerpt = ' '.join(text[left:right].split())
+    return field["name"], ('…' if left else '') + excerpt + ('…' if right < len(text) else '')
+
+
+# Query parsing: OR < AND (implicit) < NOT < terms, phrases, prefixes, parentheses
+
+QUERY_TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+:"[^"]*")|([^\s()"]+))')
+
+
+def _lex(query):
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = QUERY_TOKEN_RE.match(query, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Invalid query near: {query[position:]!r}")
+        position = match.end()
+        if match.group(1):
+            tokens.append(("(", None))
+        elif match.group(2):
+            tokens.append((")", None))
+        elif match.group(3) is not None:
+            tokens.append(("phrase", match.group(3)))
+        elif match.group(4):
+            field, value = match.group(4).split(':', 1)
+            tokens.append(("field", (field, value.strip('"'))))
+        elif match.group(5) in ("AND", "OR", "NOT"):
+            tokens.append((match.group(5), None))
+        elif ':' in match.group(5):
+            tokens.append(("field", tuple(match.group(5).split(':', 1))))
+        else:
+            tokens.append(("word", match.group(5)))
+    return tokens
+
+
+def parse_query(query):
+    """Parse a query string into a nested tuple tree."""
+    tokens = _lex(query)
+    position = 0
+
+    def peek():
+        return tokens[position][0] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        node = parse_and()
+        while peek() == "OR":
+            take()
+            node = ("or", node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() not in (None, "OR", ")"):
+            if peek() == "AND":
+                take()
+            node = ("and", node, parse_not())
+        return node
+
+    def parse_not():
+        if peek() == "NOT":
+            take()
+            return ("not", parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        kind, value = take() if position < len(tokens) else (None, None)
+        if kind == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("Missing closing parenthesis")
+            take()
+            return node
+        if kind == "word":
+            # Split like the indexer: "d'intrare" or "croche-pied" is a phrase of two words
+            words = re.findall(r'\w+\*?', value)
+            return ("word", words[0]) if len(words) == 1 else ("phrase", value)
+        if kind == "phrase":
+            return ("phrase", value)
+        if kind == "field":
+            return ("field", value)
+        raise ValueError("Incomplete query")
+
+    node = parse_or()
+    if position != len(tokens):
+        raise ValueError("Unexpected ')'")
+    return node
+
+
+def _union(*postings_list):
+    merged = {}
+    for postings in postings_list:
+        for doc_id, positions in postings.items():
+            merged.setdefault(doc_id, []).extend(positions)
+    return merged
+
+
+def _word_postings(word, index):
+    """
+    Postings of a query word: every language's stem, or if it ends with '*' every
+    token starting with its shortest stem (tokens are stored stemmed).
+    """
+    folded = fold(word.rstrip('*'))
+    stems = {stem(folded, language) for language in LANGUAGES}
+    if word.endswith('*'):
+        # Each stem is a prefix of the word: the shortest one covers the others
+        return index.prefix_postings(min(stems, key=len))
+    return _union(*(index.postings(token) for token in stems))
+
+
+def evaluate(node, index):
+    """Evaluate a parsed query to {doc_id: [matching positions]}."""
+    kind = node[0]
+    if kind == "word":
+        return _word_postings(node[1], index)
+    if kind == "field":
+        field, value = node[1]
+        token = field_token(field, value.rstrip('*'))
+        return index.prefix_postings(token) if value.endswith('*') else index.postings(token)
+    if kind == "phrase":
+        words = re.findall(r'\w+\*?', node[1])
+        if not words:
+            return {}
+        result = {doc_id: set(positions) for doc_id, positions in _word_postings(words[0], index).items()}
+        for offset, word in enumerate(words[1:], start=1):
+            following = _word_postings(word, index)
+            matched = {}
+            for doc_id, starts in result.items():
+                if doc_id in following:
+                    positions = set(following[doc_id])
+                    starts = {start for start in starts if start + offset in positions}
+                    if starts:
+                        matched[doc_id] = starts
+            result = matched
+        return {doc_id: sorted(starts) for doc_id, starts in result.items()}
+    if kind == "and":
+        left, right = evaluate(node[1], index), evaluate(node[2], index)
+        return {doc_id: positions + right[doc_id] for doc_id, positions in left.items() if doc_id in right}
+    if kind == "or":
+        return _union(evaluate(node[1], index), evaluate(node[2], index))
+    if kind == "not":
+        excluded = evaluate(node[1], index)
+        return {doc_id: [] for (doc_id,) in index.db.execute("SELECT doc_id FROM docs")
+                if doc_id not in excluded}
+    raise ValueError(f"Unknown query node {kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search the treatise corpus (phrase, prefix and boolean queries)."
+    )
+    parser.add_argument("query", help='Query, e.g. \'"porta di ferro" AND mandr*\'')
+    parser.add_argument("--limit", type=int, default=20, help="Maximum number of hits (default: 20).")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index before searching.")
+    parser.add_argument("--treatises", default=DEFAULT_TREATISES_DIR,
+                        help=f"Folder of treatise YAML files (default: {DEFAULT_TREATISES_DIR}).")
+    parser.add_argument("--glossary", default=DEFAULT_GLOSSARY,
+                        help=f"Path to the glossary YAML file (default: {DEFAULT_GLOSSARY}).")
+    parser.add_argument("--index", default=DEFAULT_SEARCH_INDEX,
+                        help=f"Path of the search index (default: {DEFAULT_SEARCH_INDEX}).")
+    args = parser.parse_args()
+
+    corpus = CorpusIndex(DEFAULT_INDEX_PATH)
+    corpus.build(args.treatises, args.glossary)
+    index = SearchIndex(args.index)
+    if args.rebuild or index.is_stale(corpus):
+        doc_count, term_count = index.build(corpus)
+        print(f"Indexed {doc_count} sections, {term_count} terms.")
+    corpus.close()
+
+    start = time.perf_counter()
+    try:
+        hits = index.search(args.query, args.limit)
+    except ValueError as e:
+        print(f"Error: {e}")
+        raise SystemExit(1)
+    elapsed = time.perf_counter() - start
+    index.close()
+
+    for section_id, field, text in hits:
+        print(f"{section_id} [{field}] {text}")
+    print(f"{len(hits)} hit(s) in {elapsed * 1000:.2f} ms.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Materialized glossary statistics over the corpus.
+
+For every treatise file, the glossary references of each section (the same
+counts yaml_annotate uses to fill the annotation fields) are aggregated into
+three sparse matrices, stored as SQLite tables:
+
+    section_terms   term x section   occurrences of a term in a section
+    treatise_terms  term x treatise  occurrences and number of sections per treatise
+    cooccurrence    term x term      number of sections of a treatise citing both terms
+
+The matrices are built from the corpus snapshot (see corpus_index.py) and
+updated per treatise: re-annotating or editing one file only recomputes the
+rows of that file. A change of the glossary term list rebuilds everything.
+
+Usage (from the spadalibreria/ folder):
+    uv run term-stats                                   # most cited terms
+    uv run term-stats --by master --category guard      # guards per master
+    uv run term-stats mandritto --category guard --master "Achille Marozzo" --book 2
+"""
+import argparse
+import sqlite3
+from itertools import combinations
+from pathlib import Path
+
+from scripts.corpus_index import (
+    DEFAULT_GLOSSARY, DEFAULT_INDEX_PATH, DEFAULT_TREATISES_DIR, CorpusIndex,
+)
+from scripts.yaml_annotate import TextEnricher
+
+DEFAULT_STATS_PATH = "data/.cache/term_stats.sqlite"
+SCHEMA_VERSION = 2
+
+# Treatise dimensions usable to filter and group the statistics
+DIMENSIONS = ("file", "master", "work", "book", "year")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    key TEXT PRIMARY KEY,
+    term TEXT NOT NULL,
+    category TEXT
+);
+CREATE TABLE IF NOT EXISTS treatises (
+    file TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    master TEXT,
+    work TEXT,
+    book TEXT,
+    year TEXT,
+    sections INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS section_terms (
+    file TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    section_id TEXT,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (file, position, key)
+);
+CREATE INDEX IF NOT EXISTS section_terms_by_key ON section_terms (key);
+CREATE TABLE IF NOT EXISTS treatise_terms (
+    file TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    sections INTEGER NOT NULL,
+    PRIMARY KEY (file, key)
+);
+CREATE TABLE IF NOT EXISTS cooccurrence (
+    file TEXT NOT NULL,
+    key TEXT NOT NULL,
+    other TEXT NOT NULL,
+    sections INTEGER NOT NULL,
+    PRIMARY KEY (key, other, file)
+);
+CREATE INDEX IF NOT EXISTS cooccurrence_by_file ON cooccurrence (file);
+"""
+
+
+def section_counts(section, enricher):
+    """Glossary key -> occurrences in the text fields of a section, as annotated by yaml_annotate."""
+    content = section.get("content") or {}
+    texts = [content.get("it"), content.get("fr")]
+    texts += [version.get("text") for version in content.get("en_versions") or []]
+    counts = {}
+    for text in texts:
+        if isinstance(text, str):
+            for key, count in enricher.enrich_with_counts(text)[1].items():
+                counts[key] = counts.get(key, 0) + count
+    return counts
+
+
+class TermStats:
+    """Build, update and query the statistics tables."""
+
+    def __init__(self, path=DEFAULT_STATS_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        version = None
+        if self.db.execute("SELECT name FROM sqlite_master WHERE name = 'meta'").fetchone():
+            version = self._meta("schema_version")
+        if version != str(SCHEMA_VERSION):
+            self.reset()
+
+    def close(self):
+        self.db.close()
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row and row[0]
+
+    def reset(self):
+        """Drop every table and recreate empty statistics."""
+        with self.db:
+            for table in ("meta", "terms", "treatises", "section_terms", "treatise_terms", "cooccurrence"):
+                self.db.execute(f"DROP TABLE IF EXISTS {table}")
+            self.db.executescript(SCHEMA)
+            self.db.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+
+    # Building
+
+    def _remove_treatise(self, file):
+        for table in ("treatises", "section_terms", "treatise_terms", "cooccurrence"):
+            self.db.execute(f"DELETE FROM {table} WHERE file = ?", (file,))
+
+    def update_treatise(self, file, sha256, sections, enricher):
+        """Recompute the rows of one treatise file from its sections, in file order."""
+        self._remove_treatise(file)
+        metadata = (sections[0].get("metadata") or {}) if sections else {}
+        self.db.execute("INSERT INTO treatises VALUES (?, ?, ?, ?, ?, ?, ?)", (
+            file, sha256, *(None if metadata.get(name) is None else str(metadata[name])
+                            for name in ("master", "work", "book", "year")),
+            len(sections)))
+
+        totals = {}
+        pairs = {}
+        rows = []
+        for position, section in enumerate(sections):
+            section_id = None if section.get("id") is None else str(section["id"])
+            counts = section_counts(section, enricher)
+            for key, count in counts.items():
+                rows.append((file, position, section_id, key, count))
+                count_total, section_total = totals.get(key, (0, 0))
+                totals[key] = (count_total + count, section_total + 1)
+            for key, other in combinations(sorted(counts), 2):
+                pairs[key, other] = pairs.get((key, other), 0) + 1
+
+        # Keyed by position like the corpus snapshot: sections sharing an id are all kept
+        self.db.executemany("INSERT INTO section_terms VALUES (?, ?, ?, ?, ?)", rows)
+        self.db.executemany("INSERT INTO treatise_terms VALUES (?, ?, ?, ?)",
+                            [(file, key, count, section_count)
+                             for key, (count, section_count) in totals.items()])
+        # Stored in both directions so that a lookup by key needs a single index range
+        self.db.executemany("INSERT INTO cooccurrence VALUES (?, ?, ?, ?)",
+                            [row for (key, other), count in pairs.items()
+                             for row in ((file, key, other, count), (file, other, key, count))])
+
+    def refresh(self, corpus, force=False):
+        """
+        Bring the statistics up to date with the corpus snapshot.
+        Only treatises whose content hash changed are recomputed.
+        Returns (updated_files, removed_files).
+        """
+        glossary = corpus.glossary()
+        enricher = TextEnricher(glossary)
+        if force or self._meta("terms") != enricher.terms_hash:
+            self.reset()
+        known = dict(self.db.execute("SELECT file, sha256 FROM treatises"))
+        sources = dict(corpus.db.execute("SELECT path, sha256 FROM sources WHERE kind = 'treatise'"))
+
+        updated = [file for file, sha256 in sorted(sources.items()) if known.get(file) != sha256]
+        removed = [file for file in known if file not in sources]
+        with self.db:
+            for file in updated:
+                sections = [section for _, section in corpus.iter_sections(file)]
+                self.update_treatise(file, sources[file], sections, enricher)
+            for file in removed:
+                self._remove_treatise(file)
+            self.db.execute("DELETE FROM terms")
+            self.db.executemany("INSERT INTO terms VALUES (?, ?, ?)",
+                                [(key, enricher.get_term(key), enricher.get_category(key))
+                                 for key in glossary])
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('terms', ?)", (enricher.terms_hash,))
+        return updated, removed
+
+    # Querying
+
+    @staticmethod
+    def _filters(filters, alias="t"):
+        """SQL condition and parameters restricting treatises on their dimensions."""
+        conditions, params = [], []
+        for name, value in filters.items():
+            if name not in DIMENSIONS:
+                raise ValueError(f"Unknown dimension {name!r}, expected one of {DIMENSIONS}")
+            if value is not None:
+                conditions.append(f"{alias}.{name} = ?")
+                params.append(str(value))
+        return "".join(f" AND {condition}" for condition in conditions), params
+
+    def term_sections(self, key):
+        """Sections citing a term: list of (section_id, occurrences), in corpus order."""
+        return self.db.execute(
+            "SELECT section_id, count FROM section_terms WHERE key = ? ORDER BY file, position",
+            (key,)).fetchall()
+
+    def frequency(self, by="file", category=None, limit=None, **filters):
+        """
+        Term occurrences grouped by a treatise dimension.
+        Returns {group value: [(key, occurrences, sections), ...]} sorted by occurrences.
+        """
+        if by not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension {by!r}, expected one of {DIMENSIONS}")
+        where, params = self._filters(filters)
+        if category is not None:
+            where += " AND g.category = ?"
+            params.append(category)
+        rows = self.db.execute(
+            f"SELECT t.{by}, s.key, SUM(s.count), SUM(s.sections) FROM treatise_terms s"
+            f" JOIN treatises t ON t.file = s.file LEFT JOIN terms g ON g.key = s.key"
+            f" WHERE 1{where} GROUP BY t.{by}, s.key ORDER BY t.{by}, SUM(s.count) DESC, s.key",
+            params)
+        groups = {}
+        for group, key, count, sections in rows:
+            group_rows = groups.setdefault(group, [])
+            if limit is None or len(group_rows) < limit:
+                group_rows.append((key, count, sections))
+        return groups
+
+    def cooccurring(self, key, category=None, limit=None, **filters):
+        """
+        Terms cited in the same sections as `key`.
+        Returns [(other key, number of shared sections), ...], most frequent first.
+        """
+        where, params = self._filters(filters)
+        if category is not None:
+            where += " AND g.category = ?"
+            params.append(category)
+        query = (f"SELECT c.other, SUM(c.sections) FROM cooccurrence c"
+                 f" JOIN treatises t ON t.file = c.file LEFT JOIN terms g ON g.key = c.other"
+                 f" WHERE c.key = ?{where} GROUP BY c.other ORDER BY SUM(c.sections) DESC, c.other")
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return self.db.execute(query, [key, *params]).fetchall()
+
+    def term(self, key):
+        """Display term of a glossary key."""
+        row = self.db.execute("SELECT term FROM terms WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else key
+
+
+def open_stats(treatises_dir=DEFAULT_TREATISES_DIR, glossary_path=DEFAULT_GLOSSARY,
+               path=DEFAULT_STATS_PATH, force=False):
+    """Update the corpus snapshot and the statistics, and return the TermStats."""
+    corpus = CorpusIndex(DEFAULT_INDEX_PATH)
+    corpus.build(treatises_dir, glossary_path)
+    stats = TermStats(path)
+    stats.refresh(corpus, force)
+    corpus.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Glossary term frequencies and co-occurrences across the corpus."
+    )
+    parser.add_argument("key", nargs="?", help="Glossary key: list the terms co-occurring with it.")
+    parser.add_argument("--category", choices=["guard", "strike", "technique", "target"],
+                        help="Only count terms of this annotation category.")
+    parser.add_argument("--by", choices=DIMENSIONS, default="file",
+                        help="Dimension used to group frequencies (default: file).")
+    parser.add_argument("--top", type=int, default=10, help="Number of terms listed per group (default: 10).")
+    for name in DIMENSIONS[1:]:
+        parser.add_argument(f"--{name}", help=f"Only count treatises whose {name} matches.")
+    parser.add_argument("--treatises", default=DEFAULT_TREATISES_DIR,
+                        help=f"Folder of treatise YAML files (default: {DEFAULT_TREATISES_DIR}).")
+    parser.add_argument("--glossary", default=DEFAULT_GLOSSARY,
+                        help=f"Path to the glossary YAML file (default: {DEFAULT_GLOSSARY}).")
+    parser.add_argument("--force", action="store_true", help="Recompute every treatise.")
+    args = parser.parse_args()
+
+    stats = open_stats(args.treatises, args.glossary, force=args.force)
+    filters = {name: getattr(args, name) for name in DIMENSIONS[1:]}
+
+    if args.key:
+        sections = stats.term_sections(args.key)
+        print(f"{stats.term(args.key)} ({args.key}): cited in {len(sections)} sections of the corpus")
+        for other, count in stats.cooccurring(args.key, args.category, args.top, **filters):
+            print(f"  {count:>5}  {stats.term(other)} ({other})")
+    else:
+        for group, rows in stats.frequency(args.by, args.category, args.top, **filters).items():
+            print(f"{group}:")
+            for key, count, sections in rows:
+                print(f"  {count:>5} occurrences, {sections:>4} sections  {stats.term(key)} ({key})")
+    stats.close()
+
+
+if __name__ == "__main__":
+    main()
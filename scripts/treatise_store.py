@@ -0,0 +1,180 @@
+"""
+Section-level access to treatise YAML files.
+
+A treatise file is a top-level list of sections, each one a block starting
+with '- ' at column 0. TreatiseStore indexes the byte range of every block so
+that a single section can be parsed, re-serialized and spliced back without
+touching the rest of the file: untouched sections keep their exact bytes,
+and a file is written atomically (temp file + rename) only if a block changed.
+
+Two loaders are used. setup_yaml() is ruamel's round-trip mode, which keeps
+comments, quoting and block styles: it is reserved for the sections that are
+written back. Consumers that only read (glossary, index, statistics,
+benchmarks) use setup_reader(), which builds plain dicts, lists and strings
+with the libyaml C parser when ruamel.yaml.clib is installed, and is many
+times faster (`uv run benchmark load`).
+"""
+import hashlib
+import io
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+from ruamel.yaml import YAML
+
+# Top-level id of a section: on the block's first line, or indented by two spaces
+ID_LINE_RE = re.compile(rb'^(?:- |  )id:[ \t]*(.*?)[ \t]*$', re.MULTILINE)
+
+
+def setup_yaml():
+    """Configure YAML instance for round-trip preservation."""
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    yaml.default_flow_style = False
+    # yaml.indent(mapping=2, sequence=2, offset=2) # Removed to match extract_book.py and default behavior
+    yaml.width = 4096
+    return yaml
+
+
+def setup_reader():
+    """YAML instance for read-only loads: plain Python data, parsed by libyaml if available."""
+    return YAML(typ='safe')
+
+
+def section_offsets(raw):
+    """
+    Locate each top-level section block of a treatise file.
+    A block starts on a line beginning with '- ' at column 0 and runs until the
+    next one (or the end of the file). Returns a list of (line, byte_offset, byte_length),
+    with 1-based line numbers.
+    """
+    starts = []
+    offset = 0
+    for line_number, line in enumerate(raw.splitlines(keepends=True), start=1):
+        if line.startswith(b'- '):
+            starts.append((line_number, offset))
+        offset += len(line)
+    return [(line, start, (starts[i + 1][1] if i + 1 < len(starts) else len(raw)) - start)
+            for i, (line, start) in enumerate(starts)]
+
+
+def block_id(block):
+    """Section id read from the raw block, without parsing it; None if not found."""
+    match = ID_LINE_RE.search(block)
+    if not match:
+        return None
+    value = match.group(1).decode('utf-8')
+    if value[:1] in ('"', "'"):
+        value = str(setup_reader().load(value))
+    return value or None
+
+
+def dump_section(section):
+    """Serialize one section as a top-level list item, like a full-file dump would."""
+    buffer = io.BytesIO()
+    setup_yaml().dump([section], buffer)
+    return buffer.getvalue()
+
+
+@contextmanager
+def atomic_open(path):
+    """
+    Binary file to write path incrementally: the data goes to a temporary file in
+    the same folder, renamed over path only if the block exits without error.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.tmp{os.getpid()}")
+    try:
+        with open(tmp_path, 'wb') as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def atomic_write(path, data):
+    """Write bytes to path through a temporary file in the same folder and a rename."""
+    with atomic_open(path) as f:
+        f.write(data)
+
+
+class TreatiseStore:
+    """
+    Sections of one treatise file, parsed on demand.
+
+    Positions are the indexes of the sections in the file. Edited and inserted
+    sections are kept in memory until save().
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._load(self.path.read_bytes())
+
+    def _load(self, raw):
+        self.raw = raw
+        self.offsets = section_offsets(raw)
+        self.header = raw[:self.offsets[0][1]] if self.offsets else raw
+        if not self.offsets and any(line.strip() and not line.lstrip().startswith((b'#', b'---'))
+                                    for line in raw.splitlines()):
+            raise ValueError("YAML root is not a list of sections")
+        self._pending = {}
+        self.ids = [block_id(self.block(position)) for position in range(len(self.offsets))]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def block(self, position):
+        """Raw bytes of a section block, including any pending edit."""
+        if position in self._pending:
+            return self._pending[position]
+        _, offset, length = self.offsets[position]
+        return self.raw[offset:offset + length]
+
+    def block_hash(self, position):
+        return hashlib.sha256(self.block(position)).hexdigest()
+
+    def load_section(self, position):
+        """Parse one section block into round-trip data, to be edited and replaced."""
+        return self._parse(setup_yaml(), position)
+
+    def read_section(self, position):
+        """Parse one section block into plain data, for reading only (see setup_reader)."""
+        return self._parse(setup_reader(), position)
+
+    def _parse(self, yaml, position):
+        data = yaml.load(self.block(position))
+        if not isinstance(data, list) or len(data) != 1:
+            raise ValueError(f"Block at line {self.offsets[position][0]} is not a single section")
+        return data[0]
+
+    def replace_section(self, position, section):
+        """Re-serialize a section in place of its block. Returns True if its bytes change."""
+        data = dump_section(section)
+        if data == self.block(position):
+            return False
+        self._pending[position] = data
+        self.ids[position] = block_id(data)
+        return True
+
+    def insert_section(self, position, section):
+        """Insert a new section before `position` (at the end if it is len(self))."""
+        data = dump_section(section)
+        # The following sections move down by one
+        self._pending = {(pending + 1 if pending >= position else pending): block
+                         for pending, block in self._pending.items()}
+        self._pending[position] = data
+        self.offsets.insert(position, None)
+        self.ids.insert(position, block_id(data))
+
+    def save(self):
+        """Write the file if a section was replaced. Returns True if it was written."""
+        if not self._pending:
+            return False
+        blocks = [self.block(position) for position in range(len(self))]
+        # A last block without final newline may no longer be the last one
+        raw = self.header + b''.join(block if block.endswith(b'\n') or position == len(blocks) - 1
+                                     else block + b'\n' for position, block in enumerate(blocks))
+        atomic_write(self.path, raw)
+        self._load(raw)
+        return True
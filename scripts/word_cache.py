@@ -0,0 +1,149 @@
+"""Cache disque des mots extraits des PDF par pdfplumber.
+
+Chaque entrée contient les enregistrements ``(text, size, doctop)`` d'une page,
+dans un format binaire compact qui peut être lu via ``mmap`` :
+
+    en-tête   : magic (4 octets), version, nombre de mots N     (struct "=4sII")
+    sizes     : N float64
+    doctops   : N float64
+    offsets   : N + 1 uint32, bornes de chaque mot dans le bloc texte
+    texte     : textes des mots concaténés, encodés en UTF-8
+
+Les nombres sont stockés dans l'ordre d'octets natif : le cache est local à la
+machine qui l'a produit.
+
+Les entrées sont indexées par le hash SHA-256 du contenu du PDF, le numéro de
+page et la version de pdfplumber : modifier le PDF ou mettre à jour pdfplumber
+invalide automatiquement le cache. La taille totale du cache est bornée ; les
+entrées les moins récemment utilisées sont supprimées en premier.
+"""
+import hashlib
+import mmap
+import os
+import struct
+from array import array
+from pathlib import Path
+
+import pdfplumber
+
+DEFAULT_CACHE_DIR = "data/.cache/words"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+MAGIC = b"SPWC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("=4sII")
+
+
+def file_hash(path):
+    """Hash SHA-256 du contenu d'un fichier."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def encode_page(words):
+    """Sérialise les mots d'une page dans le format binaire du cache."""
+    sizes = array("d", (size for _, size, _ in words))
+    doctops = array("d", (doctop for _, _, doctop in words))
+    offsets = array("I", [0])
+    chunks = []
+    position = 0
+    for text, _, _ in words:
+        encoded = text.encode("utf-8")
+        chunks.append(encoded)
+        position += len(encoded)
+        offsets.append(position)
+    return b"".join([HEADER.pack(MAGIC, FORMAT_VERSION, len(words)),
+                     sizes.tobytes(), doctops.tobytes(), offsets.tobytes(),
+                     *chunks])
+
+
+def decode_page(buffer):
+    """Relit une page sérialisée par `encode_page` (bytes ou mmap)."""
+    if len(buffer) < HEADER.size:
+        raise ValueError("Entrée de cache tronquée")
+    magic, version, count = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("Entrée de cache invalide")
+    # Longueur attendue : en-tête, tableaux, puis texte (dernière borne de `offsets`)
+    text_start = HEADER.size + 20 * count + 4
+    if len(buffer) < text_start or len(buffer) < text_start + struct.unpack_from(
+            "=I", buffer, text_start - 4)[0]:
+        raise ValueError("Entrée de cache tronquée")
+    view = memoryview(buffer)
+    start = HEADER.size
+    sizes = view[start:start + 8 * count].cast("d")
+    start += 8 * count
+    doctops = view[start:start + 8 * count].cast("d")
+    start += 8 * count
+    offsets = view[start:start + 4 * (count + 1)].cast("I")
+    start += 4 * (count + 1)
+    text = bytes(view[start:start + offsets[count]])
+    words = [(text[offsets[i]:offsets[i + 1]].decode("utf-8"), sizes[i], doctops[i])
+             for i in range(count)]
+    # Libérer les vues avant la fermeture éventuelle du mmap
+    for values in (sizes, doctops, offsets):
+        values.release()
+    view.release()
+    return words
+
+
+class WordCache:
+    """Cache des mots d'un PDF donné, une entrée par page."""
+
+    def __init__(self, pdf_path, cache_dir=DEFAULT_CACHE_DIR,
+                 max_bytes=DEFAULT_MAX_BYTES, rebuild=False):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.rebuild = rebuild
+        self.key = f"{file_hash(pdf_path)}_{pdfplumber.__version__}"
+
+    def _entry_path(self, page_num):
+        return self.cache_dir / f"{self.key}_{page_num}.bin"
+
+    def has(self, page_num):
+        return not self.rebuild and self._entry_path(page_num).exists()
+
+    def load(self, page_num):
+        """Lit les mots d'une page depuis le cache et marque l'entrée comme utilisée.
+
+        Renvoie None si l'entrée a disparu ou est illisible : un autre processus
+        peut l'avoir supprimée (`evict`) depuis l'appel à `has`.
+        """
+        path = self._entry_path(page_num)
+        try:
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    words = decode_page(buffer)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return words
+
+    def store(self, page_num, words):
+        """Écrit les mots d'une page (écriture atomique)."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._entry_path(page_num)
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+        tmp_path.write_bytes(encode_page(words))
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà de `max_bytes`."""
+        if not self.cache_dir.exists():
+            return
+        entries = []
+        for path in self.cache_dir.glob("*.bin"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -1,25 +1,25 @@
 import argparse
+import glob
+import hashlib
+import json
+import os
 import sys
 import re
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from ruamel.yaml import YAML
 from ruamel.yaml.scalarstring import PreservedScalarString
 
-def setup_yaml():
-    """Configure YAML instance for round-trip preservation."""
-    yaml = YAML()
-    yaml.preserve_quotes = True
-    yaml.default_flow_style = False
-    # yaml.indent(mapping=2, sequence=2, offset=2) # Removed to match extract_book.py and default behavior
-    yaml.width = 4096
-    return yaml
+from scripts import profiling, treatise_store
+from scripts.treatise_store import TreatiseStore, setup_reader
 
 def load_glossary(glossary_path):
     """
-    Load glossary terms from YAML file.
+    Load glossary terms from YAML file, as plain read-only data.
     Returns a dictionary mapping terms to their keys.
     """
-    yaml = setup_yaml()
+    yaml = setup_reader()
     try:
         with open(glossary_path, 'r', encoding='utf-8') as f:
             data = yaml.load(f)
@@ -28,19 +28,295 @@ def load_glossary(glossary_path):
         print(f"Error: Glossary file not found at {glossary_path}")
         sys.exit(1)
 
+def is_word_char(char):
+    """Same definition of a word character as the \\w class of `re` on str patterns."""
+    return char.isalnum() or char == '_'
+
+# Orthographic equivalences of 16th-century Italian, applied after lower-casing
+# and accent removal: typographic apostrophes, u/v and i/j are not distinguished
+SPELLING_FOLDS = str.maketrans({'\u2019': "'", '\u2018': "'", '\u02bc': "'", 'v': 'u', 'j': 'i'})
+
+class _FoldTable(dict):
+    """
+    str.translate table of the spelling-insensitive form of each character:
+    lower-cased, without accents, see SPELLING_FOLDS. Filled on first use of each character.
+    """
+    def __missing__(self, code):
+        decomposed = unicodedata.normalize('NFKD', chr(code).lower())
+        folded = ''.join(c for c in decomposed if not unicodedata.combining(c)).translate(SPELLING_FOLDS)
+        self[code] = folded
+        return folded
+
+_fold_table = _FoldTable()
+
+class _IrregularTable(dict):
+    """str.translate table keeping only the characters that do not fold to exactly one character."""
+    def __missing__(self, code):
+        self[code] = None if len(_fold_table[code]) == 1 else chr(code)
+        return self[code]
+
+_irregular_table = _IrregularTable()
+
+# Second and following letters of a run of the same letter
+DOUBLED_LETTER_RE = re.compile(r'([^\W\d_])\1+')
+
+def fold_chars(text, collapse=True):
+    """
+    Folded form of each character of text (see _FoldTable), one string per character,
+    so that positions still map to the original text. With `collapse`, a doubled
+    letter counts once (stoccatta, stoccata and stocata match): the repeated
+    letter folds to ''.
+    """
+    if not text.translate(_irregular_table):
+        # Every character folds to exactly one: fold the text in one go
+        folded = text.translate(_fold_table)
+        chars = list(folded)
+        if collapse:
+            for match in DOUBLED_LETTER_RE.finditer(folded):
+                chars[match.start() + 1:match.end()] = [''] * (match.end() - match.start() - 1)
+        return chars
+
+    chars = []
+    previous = ''
+    for char in text:
+        current = _fold_table[ord(char)]
+        if collapse and current == previous and current.isalpha():
+            chars.append('')
+        else:
+            chars.append(current)
+            if current:
+                previous = current
+    return chars
+
+def fold_text(text):
+    """Spelling-insensitive form of a text, used for glossary terms and variants."""
+    return ''.join(fold_chars(text))
+
+class RegexMatcher:
+    """
+    Match glossary terms with one \\b(term1|term2|...)\\b alternation.
+    Terms are sorted by length descending so the longest term wins. Existing
+    {key} tags are matched by the same pattern, so they are never re-enriched.
+    With `fold`, the pattern runs on the folded text (see fold_chars) and the
+    matches are mapped back to the original positions.
+    """
+    def __init__(self, term_map, fold=False):
+        self.term_map = term_map
+        self.fold = fold
+        # Sort by length descending to handle substrings correctly
+        self.sorted_terms = sorted(term_map.keys(), key=len, reverse=True)
+        pattern_str = r'(\{.*?\})'
+        if self.sorted_terms:
+            # Escape terms to handle special characters
+            pattern_str += r'|\b(' + '|'.join(re.escape(t) for t in self.sorted_terms) + r')\b'
+        self.pattern = re.compile(pattern_str, re.IGNORECASE)
+
+    def scan(self, text):
+        """
+        Yield (start, end, key, tagged) for each glossary reference in text, left to right.
+        `tagged` is True for an existing {key} tag and False for a term to replace.
+        """
+        searched = text
+        origins = None
+        if self.fold:
+            chars = fold_chars(text)
+            searched = ''.join(chars)
+            # Original position of each folded character; a match extends over
+            # the characters folded to '' that follow it
+            origins = [position for position, folded in enumerate(chars) for _ in folded]
+            origins.append(len(text))
+        for match in self.pattern.finditer(searched):
+            start, end = match.span()
+            if origins is not None:
+                # A tag ends on its closing brace, a term also takes the
+                # characters folded to '' that follow it
+                start, end = origins[start], (origins[end - 1] + 1 if match.group(1) else origins[end])
+            if match.group(1):
+                yield start, end, text[start + 1:end - 1], True
+            else:
+                key = self.term_map.get(match.group(0).lower())
+                if key:
+                    yield start, end, key, False
+
+class TrieMatcher:
+    """
+    Match glossary terms with a character trie built on the lower-cased terms.
+
+    Same semantics as RegexMatcher: a match must start and end on a word
+    boundary, the longest term starting at a position wins, and scanning
+    resumes after the match. Only positions on a word boundary are tried and
+    each attempt stops as soon as the trie has no matching branch, so the cost
+    no longer grows with the number of glossary terms. With `fold`, the text
+    is walked through its folded characters (see fold_chars); the folded terms
+    have no doubled letters, so a letter repeating the previous one is skipped
+    during the walk instead of in a separate pass over the text (as is a
+    repeated multi-letter fold, such as a doubled ligature). Characters
+    folded to '' (combining marks) are transparent, as in the folded text
+    RegexMatcher searches: a match never starts on one and takes those that
+    follow its last character.
+    """
+    _KEY = None  # Trie node entry holding the glossary key of a complete term
+
+    def __init__(self, term_map, fold=False):
+        self.fold = fold
+        self.root = {}
+        for term, key in term_map.items():
+            node = self.root
+            for char in term:
+                node = node.setdefault(char, {})
+            node[self._KEY] = key
+
+    def scan(self, text):
+        """
+        Yield (start, end, key, tagged) for each glossary reference in text, left to right.
+        `tagged` is True for an existing {key} tag and False for a term to replace.
+        """
+        fold = self.fold
+        if fold:
+            lowered = fold_chars(text, collapse=False)
+        else:
+            lowered = text.lower()
+            if len(lowered) != len(text):
+                # Some characters lower-case to several ones: fold character by character
+                lowered = [char.lower() for char in text]
+        words = [is_word_char(char) for char in text]
+        length = len(text)
+        if fold and ('' in lowered or len(''.join(lowered)) != length):
+            # Word boundaries of the folded text
+            for index, chars in enumerate(lowered):
+                if chars:
+                    words[index] = is_word_char(chars[0])
+                elif index:
+                    words[index] = words[index - 1]
+        words.append(False)
+        root = self.root
+        previous_is_word = False
+        position = 0
+        while position < length:
+            if text[position] == '{':
+                # Existing tag: closing brace on the same line, like \{.*?\}
+                close = text.find('}', position + 1)
+                if close != -1 and text.find('\n', position + 1, close) == -1:
+                    yield position, close + 1, text[position + 1:close], True
+                    previous_is_word = False
+                    position = close + 1
+                    continue
+
+            if words[position] == previous_is_word:
+                previous_is_word = words[position]
+                position += 1
+                continue
+
+            node = root
+            match_end = None
+            match_key = None
+            end = position
+            last = None
+            while end < length:
+                chars = lowered[end]
+                if not (fold and chars == last and chars.isalpha()):
+                    for char in chars:
+                        node = node.get(char)
+                        if node is None:
+                            break
+                    if node is None:
+                        break
+                if chars:
+                    last = chars
+                end += 1
+                if self._KEY in node and words[end - 1] != words[end]:
+                    match_end = end
+                    match_key = node[self._KEY]
+
+            if match_key is None:
+                previous_is_word = words[position]
+                position += 1
+            else:
+                yield position, match_end, match_key, False
+                previous_is_word = words[match_end - 1]
+                position = match_end
+
+MATCHERS = {
+    'regex': RegexMatcher,
+    'trie': TrieMatcher,
+}
+
+def _hash_json(value):
+    return hashlib.sha256(
+        json.dumps(value, ensure_ascii=False, default=str).encode('utf-8')
+    ).hexdigest()
+
+def section_hash(section):
+    """Content hash of a section, as loaded from or about to be written to YAML."""
+    return _hash_json(section)
+
+DEFAULT_MANIFEST_DIR = "data/.cache/annotations"
+DATA_ROOT = "data"
+MANIFEST_VERSION = 2
+
+def manifest_path(file_path, manifest_dir=DEFAULT_MANIFEST_DIR):
+    """
+    Manifest file of a treatise file, keyed by its path relative to the data root
+    (data/treatises/x.yaml -> <manifest_dir>/treatises/x.json), so that files with
+    the same name in different folders never share a manifest. A file outside the
+    data root is keyed by its absolute path, under <manifest_dir>/external.
+    """
+    path = Path(file_path).resolve()
+    try:
+        relative = path.relative_to(Path(DATA_ROOT).resolve())
+    except ValueError:
+        relative = Path('external', *path.parts[1:])
+    return Path(manifest_dir) / relative.with_suffix('.json')
+
+def load_manifest(file_path, manifest_dir=DEFAULT_MANIFEST_DIR):
+    """
+    Load the annotation manifest of a treatise file.
+    The manifest records, for each section id, the hash of its raw block after the last run,
+    the glossary keys it references and a hash of those glossary entries.
+    """
+    try:
+        with open(manifest_path(file_path, manifest_dir), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def save_manifest(file_path, manifest, manifest_dir=DEFAULT_MANIFEST_DIR):
+    path = manifest_path(file_path, manifest_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
 class TextEnricher:
-    def __init__(self, glossary_data):
+    """
+    Link glossary terms in texts and categorize the linked keys.
+
+    An entry matches its `term` and the spellings listed in its optional
+    `variants` field. With `fold` (the default), terms and texts are compared
+    without case, accents, doubled letters or u/v and i/j distinctions (see
+    fold_chars): the variant -> key index is built once here, and matching
+    remains a single pass over the text.
+    """
+    def __init__(self, glossary_data, matcher='trie', fold=True):
+        self.fold = fold
         self.term_map = {}
         self.term_categories = {}
         self.term_display = {}
+        variants = []
 
         for key, entry in glossary_data.items():
             term = entry.get('term', '').strip()
             term_type = entry.get('type', '')
 
             if term:
-                self.term_map[term.lower()] = key
+                self.term_map[self.normalize(term)] = key
                 self.term_display[key] = term
+            entry_variants = entry.get('variants') or []
+            if isinstance(entry_variants, str):
+                entry_variants = [entry_variants]
+            variants.extend((variant, key) for variant in entry_variants)
             
             # Categorize
             if 'Garde' in term_type:
@@ -55,16 +331,21 @@ class TextEnricher:
             else:
                 self.term_categories[key] = None
         
-        # Sort by length descending to handle substrings correctly
-        self.sorted_terms = sorted(self.term_map.keys(), key=len, reverse=True)
-        
-        if self.sorted_terms:
-            # Build regex pattern: \b(term1|term2|...)\b
-            # Escape terms to handle special characters
-            pattern_str = r'\b(' + '|'.join(re.escape(t) for t in self.sorted_terms) + r')\b'
-            self.pattern = re.compile(pattern_str, re.IGNORECASE)
-        else:
-            self.pattern = None
+        # A variant never takes over the term of another entry
+        for variant, key in variants:
+            variant = self.normalize(str(variant).strip())
+            if variant:
+                self.term_map.setdefault(variant, key)
+
+        # Fingerprint of everything that decides which text gets linked to which key
+        self.terms_hash = _hash_json(sorted(self.term_map.items()))
+
+        # Matching backend, see MATCHERS
+        self.matcher = MATCHERS[matcher](self.term_map, fold=fold)
+
+    def normalize(self, text):
+        """Form of a text compared with the term index (see fold_text)."""
+        return fold_text(text) if self.fold else text.lower()
 
     def get_category(self, key):
         return self.term_categories.get(key)
@@ -72,150 +353,373 @@ class TextEnricher:
     def get_term(self, key):
         return self.term_display.get(key, key)
 
+    def entries_hash(self, keys):
+        """Fingerprint of the glossary data (display term, category) used to annotate the given keys."""
+        return _hash_json([(key, self.get_term(key), self.get_category(key)) for key in sorted(keys)])
+
     def enrich(self, text):
-        if not text or not self.pattern:
-            return text
-            
-        # Split by existing tags to avoid double replacement
-        parts = re.split(r'(\{.*?\})', text)
-        
-        enriched_parts = []
-        for part in parts:
-            if part.startswith('{') and part.endswith('}'):
-                enriched_parts.append(part)
-            else:
-                enriched_parts.append(self._replace_terms(part))
-                
-        return ''.join(enriched_parts)
-
-    def _replace_terms(self, text):
-        def replace_func(match):
-            matched_text = match.group(0)
-            key = self.term_map.get(matched_text.lower())
+        return self.enrich_with_counts(text)[0]
+
+    def enrich_with_counts(self, text):
+        """
+        Enrich text and count its glossary references in a single scan.
+        Returns (enriched_text, counts) where counts maps each referenced key,
+        whether newly linked or already tagged, to its number of occurrences,
+        in order of first occurrence. Existing {key} tags are left untouched.
+        """
+        counts = {}
+        if not text:
+            return text, counts
+
+        parts = []
+        last = 0
+        for start, end, key, tagged in self.matcher.scan(text):
+            if not tagged:
+                parts.append(text[last:start])
+                parts.append(f'{{{key}}}')
+                last = end
             if key:
-                return f'{{{key}}}'
-            return matched_text
+                counts[key] = counts.get(key, 0) + 1
+        if not parts:
+            return text, counts
+        parts.append(text[last:])
+        return ''.join(parts), counts
+
+    def group_by_category(self, counts):
+        """
+        Split key counts by annotation category.
+        Returns {category: {display term: count}} for the categorized keys.
+        """
+        groups = {}
+        for key, count in counts.items():
+            category = self.get_category(key)
+            if category is not None:
+                groups.setdefault(category, {})[self.get_term(key)] = count
+        return groups
+
+def annotate_section(section, enricher):
+    """
+    Inject the annotation of a section if missing, enrich its text fields and fill
+    the annotation term fields.
+    Returns (annotation_added, enriched_field_count, key_counts).
+    """
+    section_id = section.get('id', 'unknown')
+    annotated = False
+    enriched_count = 0
+
+    # 1. Inject Annotation if missing
+    if 'annotation' not in section:
+        annotation_id = f"{section_id}_ann"
+        section['annotation'] = {
+            'id': annotation_id,
+            'note': None,
+            'weapons': [],
+            'weapon_type': None,
+            'guards_mentioned': {},
+            'techniques': {},
+            'measures': [],
+            'strategy': [],
+            'strikes': {},
+            'targets': {}
+        }
+        annotated = True
+
+    # 2. Enrich Content
+    content = section.get('content', {})
+    # Occurrences of every glossary key referenced in the section text,
+    # in order of first occurrence
+    key_counts = {}
+    
+    # Helper to enrich and preserve block style
+    def enrich_field(obj, key):
+        if key in obj and isinstance(obj[key], str):
+            original = obj[key]
+            enriched, counts = enricher.enrich_with_counts(original)
+            for k, count in counts.items():
+                key_counts[k] = key_counts.get(k, 0) + count
+
+            if enriched != original:
+                # Use PreservedScalarString to keep | style if it was multiline or just to be safe
+                # Check if original was multiline or if we want to force it?
+                # The Constitution says "literal blocks ... preserved".
+                # If we change the string, we must ensure it stays a literal block if it should be.
+                # Usually treatise content is multiline.
+                obj[key] = PreservedScalarString(enriched)
+                return True
+        return False
+
+    if enrich_field(content, 'it'): enriched_count += 1
+    if enrich_field(content, 'fr'): enriched_count += 1
+    
+    if 'en_versions' in content and isinstance(content['en_versions'], list):
+        for version in content['en_versions']:
+            if enrich_field(version, 'text'): enriched_count += 1
+
+    # Populate annotation fields based on found keys
+    if 'annotation' in section:
+        groups = enricher.group_by_category(key_counts)
+        section['annotation']['guards_mentioned'] = groups.get('guard')
+        section['annotation']['techniques'] = groups.get('technique')
+        section['annotation']['strikes'] = groups.get('strike')
+        section['annotation']['targets'] = groups.get('target')
+        
+        # Remove legacy count fields
+        section['annotation'].pop('guards_count', None)
+        section['annotation'].pop('techniques_count', None)
+        section['annotation'].pop('strikes_count', None)
+        section['annotation'].pop('targets_count', None)
 
-        return self.pattern.sub(replace_func, text)
+    return annotated, enriched_count, key_counts
 
-def process_file(file_path, enricher):
-    yaml = setup_yaml()
+def changed_terms(previous, current):
+    """Terms of the `current` enricher that are new or link to another key than in `previous`."""
+    return [term for term, key in current.term_map.items() if previous.term_map.get(term) != key]
+
+def contains_any(text, terms):
+    return any(term in text for term in terms)
+
+def process_file(file_path, enricher, manifest_dir=DEFAULT_MANIFEST_DIR, force=False,
+                 term_changes=None):
+    """
+    Annotate and enrich one treatise file in place.
+
+    Sections whose block and referenced glossary entries are unchanged since the
+    last run (according to the manifest) are skipped without being parsed. Only
+    the sections that actually change are re-serialized and spliced back into the
+    file, see TreatiseStore; the others keep their exact bytes. `force` ignores
+    the manifest.
+
+    A change of the glossary term list normally re-enriches every section. When
+    `term_changes` is (previous terms hash, new terms) and the manifest was built
+    with that previous term list, only the sections whose text contains one of
+    the new terms are re-enriched (see changed_terms).
+
+    Returns a dict of counts (annotated, enriched, skipped sections, written),
+    or None if the file could not be processed.
+    """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = yaml.load(f)
+        store = TreatiseStore(file_path)
+    except ValueError as e:
+        print(f"Error: {file_path}: {e}.")
+        return None
     except Exception as e:
-        print(f"Error loading YAML file: {e}")
-        return
+        print(f"Error loading YAML file {file_path}: {e}")
+        return None
 
-    if not isinstance(data, list):
-        print("Error: YAML root is not a list of sections.")
-        return
+    manifest = None if force else load_manifest(file_path, manifest_dir)
+    candidate_terms = None
+    if manifest and manifest.get('terms') != enricher.terms_hash:
+        if term_changes and manifest.get('terms') == term_changes[0]:
+            # Only the sections containing one of the new terms can match differently
+            candidate_terms = term_changes[1]
+        else:
+            # The term list changed: any section may now match a new term
+            manifest = None
+    previous_entries = manifest['sections'] if manifest else {}
+    manifest_entries = {}
 
     modified_count = 0
     enriched_count = 0
+    skipped_count = 0
+    section_keys = {}
+
+    for position in range(len(store)):
+        entry = previous_entries.get(store.ids[position])
+        if (entry and entry['hash'] == store.block_hash(position)
+                and entry['glossary'] == enricher.entries_hash(entry['keys'])
+                and not (candidate_terms and contains_any(
+                    enricher.normalize(store.block(position).decode('utf-8')), candidate_terms))):
+            manifest_entries[store.ids[position]] = entry
+            skipped_count += 1
+            continue
 
-    for section in data:
+        try:
+            section = store.load_section(position)
+        except Exception as e:
+            print(f"Error loading YAML file {file_path}: {e}")
+            return None
         section_id = section.get('id', 'unknown')
-        
-        # 1. Inject Annotation if missing
-        if 'annotation' not in section:
-            annotation_id = f"{section_id}_ann"
-            section['annotation'] = {
-                'id': annotation_id,
-                'note': None,
-                'weapons': [],
-                'weapon_type': None,
-                'guards_mentioned': {},
-                'techniques': {},
-                'measures': [],
-                'strategy': [],
-                'strikes': {},
-                'targets': {}
-            }
-            modified_count += 1
-
-        # 2. Enrich Content
-        content = section.get('content', {})
-        found_keys = set()
-        # Count occurrences of each term key
-        key_counts = {}
-        
-        # Helper to enrich and preserve block style
-        def enrich_field(obj, key):
-            if key in obj and isinstance(obj[key], str):
-                original = obj[key]
-                enriched = enricher.enrich(original)
-                
-                # Extract keys from enriched text and count them
-                keys = re.findall(r'\{([^}]+)\}', enriched)
-                for k in keys:
-                    if enricher.get_category(k) is not None:
-                        found_keys.add(k)
-                        key_counts[k] = key_counts.get(k, 0) + 1
-
-                if enriched != original:
-                    # Use PreservedScalarString to keep | style if it was multiline or just to be safe
-                    # Check if original was multiline or if we want to force it?
-                    # The Constitution says "literal blocks ... preserved".
-                    # If we change the string, we must ensure it stays a literal block if it should be.
-                    # Usually treatise content is multiline.
-                    obj[key] = PreservedScalarString(enriched)
-                    return True
-            return False
-
-        if enrich_field(content, 'it'): enriched_count += 1
-        if enrich_field(content, 'fr'): enriched_count += 1
-        
-        if 'en_versions' in content and isinstance(content['en_versions'], list):
-            for version in content['en_versions']:
-                if enrich_field(version, 'text'): enriched_count += 1
-
-        # Populate annotation fields based on found keys
-        if 'annotation' in section:
-            guards_mentioned = {}
-            techniques = {}
-            strikes = {}
-            targets = {}
-            
-            for key in found_keys:
-                cat = enricher.get_category(key)
-                term = enricher.get_term(key)
-                count = key_counts.get(key, 0)
-                
-                if cat == 'guard':
-                    guards_mentioned[term] = count
-                elif cat == 'technique':
-                    techniques[term] = count
-                elif cat == 'strike':
-                    strikes[term] = count
-                elif cat == 'target':
-                    targets[term] = count
-            
-            section['annotation']['guards_mentioned'] = guards_mentioned or None
-            section['annotation']['techniques'] = techniques or None
-            section['annotation']['strikes'] = strikes or None
-            section['annotation']['targets'] = targets or None
-            
-            # Remove legacy count fields
-            section['annotation'].pop('guards_count', None)
-            section['annotation'].pop('techniques_count', None)
-            section['annotation'].pop('strikes_count', None)
-            section['annotation'].pop('targets_count', None)
-
-    # Save back
-    with open(file_path, 'w', encoding='utf-8') as f:
-        yaml.dump(data, f)
-    
-    print(f"Completed. Added annotations to {modified_count} sections. Enriched {enriched_count} text fields.")
+        original_hash = section_hash(section)
+
+        annotated, enriched, key_counts = annotate_section(section, enricher)
+        modified_count += annotated
+        enriched_count += enriched
+
+        if section_hash(section) != original_hash:
+            store.replace_section(position, section)
+        section_keys[position] = (section_id, key_counts)
+
+    # Splice the changed sections back, only if there are any
+    changed = store.save()
+    for position, (section_id, key_counts) in section_keys.items():
+        manifest_entries[section_id] = {
+            'hash': store.block_hash(position),
+            'keys': sorted(key_counts),
+            'glossary': enricher.entries_hash(key_counts),
+        }
+
+    save_manifest(file_path, {
+        'version': MANIFEST_VERSION,
+        'terms': enricher.terms_hash,
+        'sections': manifest_entries,
+    }, manifest_dir)
+
+    return {
+        'annotated': modified_count,
+        'enriched': enriched_count,
+        'skipped': skipped_count,
+        'written': changed,
+    }
+
+def resolve_inputs(inputs, strict=True):
+    """
+    Expand the command-line inputs into a sorted list of treatise files.
+    Each input can be a file, a directory (all *.yaml files in it) or a glob pattern.
+    With `strict`, an input matching no file is an error.
+    """
+    files = set()
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            matches = path.glob('*.yaml')
+        elif path.exists():
+            matches = [path]
+        else:
+            matches = [Path(match) for match in glob.glob(item)]
+            if not matches and strict:
+                print(f"Error: Input file {item} not found.")
+                sys.exit(1)
+        files.update(matches)
+    return sorted(files)
+
+def file_states(paths):
+    """(mtime, size) of each existing path, to detect modifications by polling."""
+    states = {}
+    for path in paths:
+        try:
+            stat = Path(path).stat()
+        except FileNotFoundError:
+            continue
+        states[path] = (stat.st_mtime_ns, stat.st_size)
+    return states
+
+def watch(inputs, glossary_path, matcher='trie', interval=1.0, debounce=0.5):
+    """
+    Re-annotate the watched treatise files whenever they change, until interrupted.
+
+    Files and glossary are polled every `interval` seconds. Once a change is seen,
+    nothing is processed until the files stay unchanged for `debounce` seconds,
+    so a burst of writes is handled once. The enricher stays in memory and is only
+    rebuilt when the glossary changes; the files are then re-scanned for the new
+    terms only (see process_file). All files are brought up to date at startup.
+    """
+    glossary_path = Path(glossary_path)
+
+    def poll():
+        return (file_states(resolve_inputs(inputs, strict=False)),
+                file_states([glossary_path]).get(glossary_path))
+
+    enricher = TextEnricher(load_glossary(glossary_path), matcher=matcher)
+    print(f"Loaded {len(enricher.term_map)} terms from glossary.")
+    known = {}
+    files, glossary_state = poll()
+    print(f"Watching {len(files)} files and {glossary_path} (Ctrl+C to stop)...")
+    try:
+        while True:
+            files, glossary_now = poll()
+            if glossary_now == glossary_state and all(known.get(path) == state
+                                                      for path, state in files.items()):
+                time.sleep(interval)
+                continue
+
+            # Wait for the writes to settle
+            while True:
+                time.sleep(debounce)
+                latest = poll()
+                if latest == (files, glossary_now):
+                    break
+                files, glossary_now = latest
+
+            term_changes = None
+            changed = [path for path, state in files.items() if known.get(path) != state]
+            # A missing glossary is being replaced: wait for the new version
+            if glossary_now != glossary_state and glossary_now is not None:
+                glossary_state = glossary_now
+                try:
+                    updated = TextEnricher(load_glossary(glossary_path), matcher=matcher)
+                except Exception as e:
+                    print(f"Glossary not reloaded, keeping the previous one: {e}")
+                    updated = None
+                if updated is not None:
+                    new_terms = changed_terms(enricher, updated)
+                    print(f"Glossary reloaded: {len(updated.term_map)} terms, "
+                          f"{len(new_terms)} new or relinked.")
+                    term_changes = (enricher.terms_hash, new_terms)
+                    enricher = updated
+                    # Changed entries or new terms may concern any file
+                    changed = list(files)
+
+            for path in changed:
+                start = time.perf_counter()
+                result = process_file(path, enricher, term_changes=term_changes)
+                # Remember the state after our own write, so it is not taken for an edit
+                known[path] = file_states([path]).get(path)
+                if result is None:
+                    print(f"  {path}: failed")
+                else:
+                    print(f"  {path}: {describe_result(result)} ({time.perf_counter() - start:.2f}s)")
+            known = {path: state for path, state in known.items() if path in files}
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+# Enricher shared by every file handled in a worker process, set once by _init_worker
+_worker_enricher = None
+
+def _init_worker(enricher):
+    global _worker_enricher
+    _worker_enricher = enricher
+
+def _annotate_timed(file_path, force=False):
+    start = time.perf_counter()
+    result = process_file(file_path, _worker_enricher, force=force)
+    return result, time.perf_counter() - start
+
+def annotate_files(files, enricher, jobs=None, force=False):
+    """
+    Annotate several treatise files with the same enricher, using a process pool.
+    The enricher (term map and compiled pattern) is sent once to each worker at startup.
+    Yields (file_path, result, seconds) in input order.
+    """
+    jobs = min(jobs or os.cpu_count() or 1, len(files))
+    if jobs <= 1:
+        _init_worker(enricher)
+        for file_path in files:
+            yield file_path, *_annotate_timed(file_path, force)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(enricher,)) as executor:
+        results = executor.map(_annotate_timed, files, [force] * len(files))
+        for file_path, (result, seconds) in zip(files, results):
+            yield file_path, result, seconds
+
+def describe_result(result):
+    summary = (f"added annotations to {result['annotated']} sections, "
+               f"enriched {result['enriched']} text fields, "
+               f"skipped {result['skipped']} unchanged sections")
+    if not result['written']:
+        summary += ", file unchanged"
+    return summary
 
 def main():
     parser = argparse.ArgumentParser(
         description="Add annotation fields and enrich text with glossary links in treatise YAML files."
     )
     parser.add_argument(
-        "input_file",
+        "inputs",
+        nargs='+',
         type=str,
-        help="Path to the treatise YAML file to process."
+        help="Treatise YAML files to process: file paths, directories (every *.yaml inside) or glob patterns."
     )
     parser.add_argument(
         "--glossary",
@@ -223,23 +727,124 @@ def main():
         default="data/glossary.yaml",
         help="Path to the glossary YAML file (default: data/glossary.yaml)."
     )
+    parser.add_argument(
+        "--matcher",
+        choices=sorted(MATCHERS),
+        default="trie",
+        help="Glossary term matching backend (default: trie)."
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-enrich every section, ignoring the annotation manifests in data/.cache/annotations."
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of worker processes when several files are given (default: one per CPU)."
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and re-annotate the input files (and every file after a glossary change) when they are modified."
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="With --watch, seconds between two checks for modifications (default: 1)."
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.5,
+        help="With --watch, seconds without further writes before a change is processed (default: 0.5)."
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the time and call count of each stage (YAML load, enrichment, dump...) at the end."
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="With the profile, also record the peak memory allocated by each stage (slower)."
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        help="Also save a cProfile dump (.prof) of the whole run to this file."
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Log the time spent on each annotated section."
+    )
 
     args = parser.parse_args()
     
-    input_path = Path(args.input_file)
-    if not input_path.exists():
-        print(f"Error: Input file {input_path} not found.")
+    if args.watch:
+        with profiling.session(profiled_stages(), args.profile, args.profile_memory,
+                               args.profile_output, args.trace):
+            watch(args.inputs, args.glossary, args.matcher, args.interval, args.debounce)
+        return
+
+    files = resolve_inputs(args.inputs)
+    if not files:
+        print("Error: No treatise file to process.")
         sys.exit(1)
 
-    print(f"Processing {input_path}...")
-    
-    # Load glossary
+    profiled = args.profile or args.profile_memory or args.profile_output or args.trace
+    if profiled and len(files) > 1 and args.jobs != 1:
+        # Worker processes are not instrumented
+        print("Profiling: processing the files in a single process (--jobs 1).")
+        args.jobs = 1
+    with profiling.session(profiled_stages(), args.profile, args.profile_memory,
+                           args.profile_output, args.trace):
+        run(args, files)
+
+def profiled_stages():
+    """Stages timed by --profile and --trace, see scripts/profiling.py."""
+    module = sys.modules[__name__]
+    return [
+        (module, "load_glossary", "load glossary"),
+        (module, "process_file", "process_file"),
+        (module, "load_manifest", "load manifest"),
+        (module, "save_manifest", "save manifest"),
+        (TreatiseStore, "_load", "read and index file"),
+        (TreatiseStore, "load_section", "yaml load (ruamel)"),
+        (module, "annotate_section", "annotate section",
+         lambda section, enricher: section.get('id', 'unknown')),
+        (TextEnricher, "enrich_with_counts", "enrich (term scan)"),
+        (treatise_store, "dump_section", "yaml dump (ruamel)"),
+        (TreatiseStore, "save", "write file"),
+    ]
+
+def run(args, files):
+    # Load glossary once for every file
     glossary_data = load_glossary(args.glossary)
     print(f"Loaded {len(glossary_data)} terms from glossary.")
     
-    enricher = TextEnricher(glossary_data)
+    enricher = TextEnricher(glossary_data, matcher=args.matcher)
+
+    if len(files) == 1:
+        print(f"Processing {files[0]}...")
+        result = process_file(files[0], enricher, force=args.force)
+        if result:
+            print(f"Completed: {describe_result(result)}.")
+        return
 
-    process_file(input_path, enricher)
+    print(f"Processing {len(files)} files...")
+    start = time.perf_counter()
+    failures = 0
+    for file_path, result, seconds in annotate_files(files, enricher, args.jobs, args.force):
+        if result is None:
+            failures += 1
+            print(f"  {file_path}: failed ({seconds:.2f}s)")
+        else:
+            print(f"  {file_path}: {describe_result(result)} ({seconds:.2f}s)")
+    print(f"Completed {len(files) - failures}/{len(files)} files in {time.perf_counter() - start:.2f}s.")
 
 if __name__ == "__main__":
     main()